@@ -0,0 +1,156 @@
+# agents/intent_matcher.py
+
+import re
+import difflib
+import logging
+import threading
+import pandas as pd
+from collections import Counter
+from rich.console import Console
+
+console = Console()
+
+# Initialize the logger
+logger = logging.getLogger(__name__)
+
+# Minimum difflib similarity for a phrase of the question to name a column
+COLUMN_MATCH_CUTOFF = 0.85
+
+_AGGREGATIONS = {
+    "average": "mean", "mean": "mean", "avg": "mean",
+    "total": "sum", "sum": "sum",
+    "median": "median",
+    "maximum": "max", "max": "max", "highest": "max",
+    "minimum": "min", "min": "min", "lowest": "min",
+}
+_AGGREGATION_WORDS = "|".join(sorted(_AGGREGATIONS, key=len, reverse=True))
+_DATA = r"(?:the |this |my )?(?:data|dataset|data set|dataframe|table|file|csv)"
+
+_SHOW_DATA = re.compile(
+    rf"^(?:(?:show|display|view|print|give)(?: me)? (?:the |all (?:the )?)?"
+    rf"(?:data|dataset|data set|dataframe|table|file|csv|rows|records)"
+    rf"|what does {_DATA} look like)$"
+)
+_HEAD_TAIL = re.compile(
+    r"^(?:show|display|view|print|give)(?: me)? (?:the )?(?P<end>first|top|last|bottom) (?P<n>\d+) (?:rows|records|entries)$"
+)
+_ROW_COUNT = re.compile(
+    rf"^(?:how many (?:rows|records|entries|lines)(?: are there)?(?: (?:in|does) {_DATA}(?: have)?)?"
+    rf"|(?:what is |what's )?(?:the )?(?:number|count) of (?:rows|records|entries)(?: (?:in )?{_DATA})?"
+    rf"|how (?:big|large|long) is {_DATA})$"
+)
+_COLUMNS = re.compile(
+    rf"^(?:(?:what|which) (?:columns|fields|variables)(?: are there)?(?: (?:in|does) {_DATA}(?: have)?)?"
+    rf"|(?:show|list|give)(?: me)?(?: all)? (?:the )?(?:columns|column names|fields)(?: (?:of|in) {_DATA})?)$"
+)
+_AGGREGATE = re.compile(
+    rf"^(?:what is |what's |what are |show(?: me)? |compute |calculate |give me )?(?:the )?"
+    rf"(?P<agg>{_AGGREGATION_WORDS}) (?:of )?(?:the )?(?P<value>.+?)"
+    rf"(?: (?:by|per|for each|for every|grouped by|across) (?:each )?(?:the )?(?P<group>.+?))?$"
+)
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _normalize(question):
+    # Apostrophes are kept for contractions like "what's"
+    text = question.lower().replace("\u2019", "'")
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s']", " ", text)).strip()
+
+
+def _column_key(name):
+    return re.sub(r"[\W_]+", "", str(name).lower())
+
+
+def resolve_column(phrase, columns):
+    """
+    Returns the column 'phrase' refers to, matching names regardless of case, spaces and
+    underscores and tolerating small typos. Returns None if no column or more than one
+    column matches equally well.
+    """
+    keys = {}
+    for column in columns:
+        keys.setdefault(_column_key(column), []).append(column)
+    target = _column_key(phrase)
+    if not target:
+        return None
+    if target in keys:
+        return keys[target][0] if len(keys[target]) == 1 else None
+
+    scored = sorted(
+        ((difflib.SequenceMatcher(None, target, key).ratio(), key) for key in keys),
+        reverse=True,
+    )
+    scored = [(score, key) for score, key in scored if score >= COLUMN_MATCH_CUTOFF]
+    if not scored or (len(scored) > 1 and scored[0][0] == scored[1][0]) or len(keys[scored[0][1]]) > 1:
+        return None
+    return keys[scored[0][1]][0]
+
+
+def _aggregate_code(match, columns, numeric_columns):
+    function = _AGGREGATIONS[match.group("agg")]
+    value = resolve_column(match.group("value"), columns)
+    if value is None or value not in numeric_columns:
+        return None
+    if match.group("group") is None:
+        return f"query_result = df[{value!r}].{function}()"
+    group = resolve_column(match.group("group"), columns)
+    if group is None or group == value:
+        return None
+    return f"query_result = df.groupby({group!r})[{value!r}].{function}().reset_index()"
+
+
+def _match(question, columns, numeric_columns):
+    text = _normalize(question)
+    if _SHOW_DATA.match(text):
+        return "show_data", "query_result = df.head()"
+    match = _HEAD_TAIL.match(text)
+    if match:
+        method = "head" if match.group("end") in ("first", "top") else "tail"
+        return "show_data", f"query_result = df.{method}({int(match.group('n'))})"
+    if _ROW_COUNT.match(text):
+        return "row_count", "query_result = len(df)"
+    if _COLUMNS.match(text):
+        return "columns", 'query_result = pd.DataFrame({"column": df.columns, "dtype": df.dtypes.astype(str).to_numpy()})'
+    match = _AGGREGATE.match(text)
+    if match:
+        code = _aggregate_code(match, columns, numeric_columns)
+        if code:
+            return "aggregate", code
+    return None, None
+
+
+def match_intent(question, dtypes):
+    """
+    Recognizes common question templates (show the data, row count, list the columns,
+    '<aggregation> of X [by Y]') against the dataset's columns ('dtypes', e.g. df.dtypes)
+    and returns the pandas code answering them, or None if the question should go to the LLM.
+    """
+    numeric_columns = {
+        column for column, dtype in dtypes.items()
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+    }
+    intent, code = _match(question, list(dtypes.index), numeric_columns)
+    with _stats_lock:
+        _stats[intent or "fallback"] += 1
+    if code:
+        logger.info(f"Question matched the '{intent}' template: {code}")
+    return code
+
+
+def intent_stats():
+    """
+    Questions answered from templates per intent, LLM fallbacks and the resulting hit rate.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    fallbacks = stats.pop("fallback", 0)
+    matched = sum(stats.values())
+    total = matched + fallbacks
+    return {
+        "matched": matched,
+        "fallbacks": fallbacks,
+        "hit_rate": matched / total if total else 0.0,
+        "by_intent": stats,
+    }
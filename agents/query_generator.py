@@ -1,12 +1,15 @@
 # agents/query_generator.py
 
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains import LLMChain
 from dotenv import load_dotenv
 import os
 import logging
 from rich.console import Console
+from utils.code_analyzer import prepare_code, CodeAnalysisError, QUERY_NAMES
+from utils.catalog import catalog_prompt
+from agents.intent_matcher import match_intent
 
 console = Console()
 load_dotenv()
@@ -17,8 +20,30 @@ logger = logging.getLogger(__name__)
 # Initialize the OpenAI LLM with LangChain
 llm = ChatOpenAI(model_name="o1-mini")
 
-def generate_pandas_query(question, schema, data_dictionary):
+# How many times a rejected query is sent back to the LLM for a targeted rewrite
+MAX_REGENERATIONS = 2
+
+def generate_pandas_query(question, schema, data_dictionary, catalog=None, dtypes=None):
+    """
+    Generates pandas code answering the question on 'df'. 'catalog' optionally maps
+    variable names to the ids of further datasets the code may use, e.g. for joins;
+    only their schema summaries go into the prompt.
+    If the column dtypes of 'df' are given, common questions about 'df' alone are
+    answered from templates without calling the LLM.
+    """
     logger.info("Generating pandas query.")
+    catalog = catalog or {}
+    if dtypes is not None and not catalog:
+        pandas_query = match_intent(question, dtypes)
+        if pandas_query:
+            return pandas_query
+    allowed_names = QUERY_NAMES | frozenset(catalog)
+    other_datasets = ""
+    if catalog:
+        other_datasets = (
+            "Other datasets, available as dataframes under these variable names (use them only when "
+            "the question needs them, e.g. to merge with df):\n" + catalog_prompt(catalog)
+        )
 
     prompt = ChatPromptTemplate.from_messages(
         [
@@ -31,6 +56,8 @@ def generate_pandas_query(question, schema, data_dictionary):
                 You should not put any code in triple backticks.
                 Do not use  ```python```, just use plain text.
                 The query result should be store in a variable named 'query_result'
+                Use vectorized pandas operations. Do not loop over rows, do not use iterrows() and do not use apply with axis=1.
+                The dataframe is available as 'df', pandas as 'pd' and numpy as 'np'; do not import anything.
                 If user asked about the whole dataset without any sepecific query, you just return query_result=df.head()
                 If user asked for help in a decision, generate a good pandas query based on schema to help him. 
                 Note that, when you want generate a query like df["columnX"] == "value", you should note the "value" be in provided unique values of columnX.
@@ -46,33 +73,44 @@ def generate_pandas_query(question, schema, data_dictionary):
                 Data Dictionary:
                 {data_dictionary}
 
+                {other_datasets}
+
                 Pandas Query:
                 """,
             ),
             ("human", "{question}"),
+            MessagesPlaceholder("feedback", optional=True),
         ]
     )
     chain = prompt | llm 
-    _input = {"schema": schema, "question": question, "data_dictionary": data_dictionary}
-    response = chain.invoke(_input)
-
-
-    # Extract the query code from the response
-    code = response.content.strip()
-    console.log(f"Generated code: {code}")
-
-    # Sanitize and validate the code if necessary
-    # if 'query' in code:
-    #     try:
-    #         exec_globals = {}
-    #         exec(code, {}, exec_globals)
-    #         pandas_query = exec_globals.get("query", "")
-    #     except Exception as e:
-    #         logger.error(f"Error executing generated code: {e}")
-    #         pandas_query = ""
-    # else:
-    #     pandas_query = code  # Assuming the code itself is the query string
-
-    pandas_query = code
-    logger.info(f"Generated pandas query: {pandas_query}")
-    return pandas_query
+    _input = {
+        "schema": schema,
+        "question": question,
+        "data_dictionary": data_dictionary,
+        "other_datasets": other_datasets,
+    }
+    feedback = []
+
+    for attempt in range(MAX_REGENERATIONS + 1):
+        response = chain.invoke({**_input, "feedback": feedback})
+
+        # Extract the query code from the response
+        code = response.content.strip()
+        console.log(f"Generated code: {code}")
+
+        # Reject or rewrite slow and unsafe patterns before the code is executed
+        try:
+            pandas_query, _ = prepare_code(code, allowed_names)
+        except CodeAnalysisError as e:
+            logger.warning(f"Generated query rejected (attempt {attempt + 1}): {e}")
+            feedback = [
+                ("ai", code),
+                ("human", f"This query was rejected: {e} Rewrite it following the same rules."),
+            ]
+            continue
+
+        logger.info(f"Generated pandas query: {pandas_query}")
+        return pandas_query
+
+    logger.error("Failed to generate an acceptable pandas query.")
+    return ""
@@ -1,7 +1,7 @@
 # agents/visualizer.py
 
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from dotenv import load_dotenv
 import os
 import plotly.io as pio
@@ -10,7 +10,11 @@ import plotly.express as px  # Import Plotly Express
 import logging
 from rich.console import Console
 import ast
+from contextlib import nullcontext
 import pandas as pd
+import numpy as np
+from utils.code_analyzer import prepare_code, make_namespace, CodeAnalysisError, PLOTLY_NAMES
+from utils.profiler import profiled
 
 console = Console()
 load_dotenv()
@@ -22,6 +26,9 @@ logger.setLevel(logging.DEBUG)
 # Initialize the OpenAI LLM with LangChain
 llm = ChatOpenAI(model_name="o1-mini")
 
+# How many times rejected Plotly code is sent back to the LLM for a targeted rewrite
+MAX_REGENERATIONS = 2
+
 
 def generate_plotly_code(question, schema):
     logger.info("Generating Plotly code.")
@@ -46,23 +53,38 @@ def generate_plotly_code(question, schema):
                 """,
             ),
             ("human", "{question}"),
+            MessagesPlaceholder("feedback", optional=True),
         ]
     )
 
     chain = prompt | llm
     _input = {"schema": schema, "question": question}
+    feedback = []
+
+    for attempt in range(MAX_REGENERATIONS + 1):
+        response = chain.invoke({**_input, "feedback": feedback})
 
-    response = chain.invoke(_input)
+        logger.debug(f"LLM response: {response.content}")
 
-    logger.debug(f"LLM response: {response.content}")
+        # Extract the code (assuming the response contains only the code)
+        code = response.content.strip()
+        console.log(f"Generated code: {code}")
 
-    # Extract the code (assuming the response contains only the code)
-    code = response.content.strip()
-    console.log(f"Generated code: {code}")
+        try:
+            plotly_code, _ = prepare_code(code, PLOTLY_NAMES)
+        except CodeAnalysisError as e:
+            logger.warning(f"Generated Plotly code rejected (attempt {attempt + 1}): {e}")
+            feedback = [
+                ("ai", code),
+                ("human", f"This code was rejected: {e} Rewrite it following the same rules."),
+            ]
+            continue
 
-    plotly_code = code
-    logger.info(f"Generated Plotly code: {plotly_code}")
-    return plotly_code
+        logger.info(f"Generated Plotly code: {plotly_code}")
+        return plotly_code
+
+    logger.error("Failed to generate acceptable Plotly code.")
+    return ""
 
 
 def validate_plotly_code(plotly_code, df):
@@ -129,28 +151,36 @@ def validate_plotly_code(plotly_code, df):
         return False
 
 
-def get_plotly_json(plotly_code, df):
+def get_plotly_json(plotly_code, df, index=None, profile_report=None):
+    """
+    Runs the generated Plotly code and returns the figure as JSON. If 'profile_report'
+    is a dict, the execution is profiled into it.
+    """
     logger.info("Generating Plotly JSON.")
     # Prepare a namespace for exec
-    namespace = {
-        'df': df,
-        'go': go,
-        'pio': pio,
-        'pd': pd,
-        'px': px  # Include Plotly Express in the namespace
-    }
+    namespace = make_namespace(
+        index=index,
+        df=df.copy(deep=False),
+        go=go,
+        pio=pio,
+        pd=pd,
+        np=np,
+        px=px  # Include Plotly Express in the namespace
+    )
     try:
-        # Validate the generated code
-        # if not validate_plotly_code(plotly_code, df):
-        #     raise ValueError("Validation failed for the generated Plotly code.")
-
-        exec(plotly_code, namespace)
-        fig = namespace.get('fig', None)
-        if fig is None:
-            raise ValueError("Plotly code did not create a figure named 'fig'.")
-
-        # Convert figure to JSON
-        fig_json = fig.to_json()
+        # Validate the generated code and reuse its cached compiled form
+        source, code_object = prepare_code(plotly_code, PLOTLY_NAMES)
+
+        with profiled(source) if profile_report is not None else nullcontext({}) as report:
+            exec(code_object, namespace)
+            fig = namespace.get('fig', None)
+            if fig is None:
+                raise ValueError("Plotly code did not create a figure named 'fig'.")
+
+            # Convert figure to JSON
+            fig_json = fig.to_json()
+        if profile_report is not None:
+            profile_report.update(report)
         logger.info("Plotly JSON generated successfully.")
         return fig_json
     except Exception as e:
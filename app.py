@@ -1,18 +1,38 @@
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Query, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from utils.data_loader import load_csv
 from utils.schema_extractor import extract_schema, extract_data_dictionary
-from utils.summary_generator import generate_summary
+from utils.summary_generator import generate_summary, summary_stats
 from agents.query_generator import generate_pandas_query
+from agents.intent_matcher import intent_stats
 from agents.response_generator import generate_final_response
 from agents.visualizer import generate_plotly_code, get_plotly_json
+from utils.code_analyzer import prepare_code, make_namespace, normalize_code, referenced_names, QUERY_NAMES
+from utils.catalog import build_catalog, dataset_aliases
+from utils.result_cache import get_cached, put_cached, cache_stats, MISS
+from utils.profiler import profiled, top_offenders
+from utils.speculation import start_speculation, take_speculation, cancel_speculation, speculation_stats
+from utils.coalescer import coalesced, normalize_question, coalescing_stats
+from utils.result_store import store_result, get_result, STREAM_WRITERS, DOWNLOAD_FORMATS
+from utils.dataset_store import (
+    DATA_DIR, UPLOADS_DIR, CHUNK_SIZE, UploadError, dataset_exists, load_dataset,
+    add_dataset, begin_upload, append_chunk, complete_upload, upload_offset, list_datasets,
+)
 
 import os
+import time
+import asyncio
+import json
+import uuid
+import hashlib
 import logging
+from contextlib import nullcontext
+from typing import Optional
 from rich.console import Console
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 
 console = Console()
 
@@ -31,40 +51,274 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-DATA_DIR = "data"
+# Generated code may take shallow copies of the dataframe instead of deep ones
+# (Copy-on-Write is always on from pandas 3.0)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 # Ensure the data directory exists
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
 
+def execute_query(pandas_query, df, index, dataset_id, profile_report=None, catalog=None):
+    """
+    Runs an analyzed pandas query against the dataframe and returns its 'query_result'.
+    The query gets a shallow copy of the shared dataframe; with Copy-on-Write any
+    change it makes stays private to this execution.
+    Datasets of the 'catalog' (alias -> dataset id) are only loaded if the query
+    references their alias.
+    Results are cached per dataset on the normalized form of the query, so
+    equivalent snippets are only executed once. Cached results are shared and
+    must not be modified.
+    If 'profile_report' is a dict, the cache is bypassed and the execution is
+    profiled into it.
+    """
+    catalog = catalog or {}
+    allowed_names = QUERY_NAMES | frozenset(catalog)
+    source, code_object = prepare_code(pandas_query, allowed_names)
+    used_datasets = {alias: catalog[alias] for alias in sorted(referenced_names(source) & set(catalog))}
+    cache_key = (dataset_id, tuple(used_datasets.items()), normalize_code(source, allowed_names))
+    if profile_report is None:
+        query_result = get_cached(cache_key)
+        if query_result is not MISS:
+            logger.info("Query result served from cache.")
+            return query_result
+
+    frames = {}
+    for alias, used_id in used_datasets.items():
+        frame, _ = load_dataset(used_id, with_index=False)
+        if frame is None:
+            raise ValueError(f"Failed to load dataset '{alias}'.")
+        frames[alias] = frame.copy(deep=False)
+
+    started = time.perf_counter()
+    _vars = make_namespace(index=index, df=df.copy(deep=False), pd=pd, np=np, query_result=None, **frames)
+    with profiled(source) if profile_report is not None else nullcontext({}) as report:
+        exec(code_object, _vars)
+    if profile_report is not None:
+        profile_report.update(report)
+    query_result = _vars.get('query_result', None)
+    if query_result is None:
+        raise ValueError("The generated query did not assign a value to 'query_result'.")
+    put_cached(cache_key, query_result, time.perf_counter() - started)
+    return query_result
+
+
+def flight_key(kind, dataset_id, catalog, question, pandas_query=None):
+    """
+    Identifies a computation for request coalescing. Datasets never change under
+    their content id, so the ids and the normalized question determine its result;
+    computations built on an executed query also depend on that query, since asking
+    again may generate a different one.
+    """
+    key = (kind, dataset_id, tuple(catalog.values()), normalize_question(question))
+    if pandas_query is not None:
+        key += (normalize_code(pandas_query, QUERY_NAMES | frozenset(catalog)),)
+    return key
+
+
+def answer_query(question, schema, data_dictionary, df, index, dataset_id, catalog, profile_report=None):
+    """
+    Generates the pandas query for the question and executes it. Returns the query
+    and its 'query_result'; the query is empty if no valid one could be generated.
+    """
+    pandas_query = generate_pandas_query(question, schema, data_dictionary, catalog, df.dtypes)
+    if not pandas_query:
+        return pandas_query, None
+    return pandas_query, execute_query(pandas_query, df, index, dataset_id, profile_report, catalog)
+
+
+async def run_query(question, schema, data_dictionary, df, index, dataset_id, catalog, profile_report=None):
+    """
+    Runs answer_query in a worker thread. Unless the execution is profiled, a request
+    identical to one already in flight waits for that one instead of calling the LLM again.
+    """
+    if profile_report is not None:
+        return await asyncio.to_thread(
+            answer_query, question, schema, data_dictionary, df, index, dataset_id, catalog, profile_report
+        )
+    return await asyncio.to_thread(
+        coalesced,
+        flight_key("query", dataset_id, catalog, question),
+        lambda: answer_query(question, schema, data_dictionary, df, index, dataset_id, catalog),
+    )
+
+
+def build_final_response(question, pandas_query, query_result, df):
+    """
+    Generates the natural language answer for an executed query. The dataset summary
+    only covers the columns the query and the question refer to.
+    """
+    summary = generate_summary(df, question, pandas_query)
+    return generate_final_response(question, query_result, summary)
+
+
+def build_plotly_json(question, schema, df, index, profile_report=None):
+    """
+    Generates Plotly code for the question and runs it. Returns (plotly_code, plotly_json);
+    either is empty if that step failed.
+    """
+    plotly_code = generate_plotly_code(question, schema)
+    if not plotly_code:
+        return plotly_code, None
+    return plotly_code, get_plotly_json(plotly_code, df, index, profile_report)
+
+
 @app.post("/upload_csv/")
-async def upload_csv(file: UploadFile = File(...)):
+async def upload_csv(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """
+    Endpoint to upload a CSV file in a single request.
+    The file is stored under its sha256 content id, which is returned as 'dataset_id'.
+    """
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    temp_location = os.path.join(UPLOADS_DIR, f"{uuid.uuid4().hex}.tmp")
+    hasher = hashlib.sha256()
+
+    def write(chunk):
+        hasher.update(chunk)
+        file_object.write(chunk)
+
+    with open(temp_location, "wb") as file_object:
+        while chunk := await file.read(CHUNK_SIZE):
+            await asyncio.to_thread(write, chunk)
+    dataset_id = await asyncio.to_thread(add_dataset, temp_location, hasher.hexdigest(), file.filename)
+    # Parse and index the dataset ahead of the first question
+    background_tasks.add_task(load_dataset, dataset_id)
+    logger.info(f"File '{file.filename}' saved as dataset '{dataset_id}'")
+    return {"info": f"file '{file.filename}' saved as dataset '{dataset_id}'", "dataset_id": dataset_id}
+
+
+@app.post("/uploads/")
+async def start_upload(content_id: str = Form(...)):
+    """
+    Endpoint to start or resume a content-addressed upload.
+    'content_id' is the sha256 hex digest of the file. If the server already has
+    those bytes nothing needs to be sent; otherwise the response tells the client
+    from which offset to continue sending chunks.
+    """
+    if dataset_exists(content_id):
+        logger.info(f"Dataset '{content_id}' already uploaded, skipping transfer")
+        return {"exists": True, "dataset_id": content_id}
+    try:
+        offset = begin_upload(content_id)
+    except UploadError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return {"exists": False, "offset": offset, "chunk_size": CHUNK_SIZE}
+
+
+@app.put("/uploads/{content_id}")
+async def upload_chunk(content_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """
+    Endpoint to append one chunk (the raw request body) to an upload at 'offset'.
+    Chunks may be at most CHUNK_SIZE bytes.
     """
-    Endpoint to upload a CSV file.
+    too_large = JSONResponse(
+        content={"error": f"Chunks may be at most {CHUNK_SIZE} bytes."},
+        status_code=413,
+    )
+    if int(request.headers.get("content-length") or 0) > CHUNK_SIZE:
+        return too_large
+    data = bytearray()
+    async for part in request.stream():
+        data.extend(part)
+        if len(data) > CHUNK_SIZE:
+            return too_large
+    try:
+        new_offset = await asyncio.to_thread(append_chunk, content_id, offset, bytes(data))
+    except UploadError as e:
+        logger.warning(f"Rejected chunk for '{content_id}': {e}")
+        return JSONResponse(
+            content={"error": str(e), "offset": upload_offset(content_id)},
+            status_code=409,
+        )
+    return {"offset": new_offset}
+
+
+@app.post("/uploads/{content_id}/complete")
+async def finish_upload(background_tasks: BackgroundTasks, content_id: str, filename: str = Form(...)):
     """
-    file_location = f"{DATA_DIR}/{file.filename}"
-    with open(file_location, "wb+") as file_object:
-        file_object.write(await file.read())
-    logger.info(f"File '{file.filename}' saved at '{file_location}'")
-    return {"info": f"file '{file.filename}' saved at '{file_location}'"}
+    Endpoint to verify a finished upload against its content id and make it available as a dataset.
+    """
+    if dataset_exists(content_id):
+        return {"dataset_id": content_id}
+    try:
+        # Hashing the whole file takes seconds for large uploads
+        dataset_id = await asyncio.to_thread(complete_upload, content_id, filename)
+    except UploadError as e:
+        logger.error(f"Failed to complete upload: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    # Parse and index the dataset ahead of the first question
+    background_tasks.add_task(load_dataset, dataset_id)
+    return {"dataset_id": dataset_id}
+
+
+@app.get("/datasets/")
+async def get_datasets():
+    """
+    Endpoint listing the uploaded datasets that can be queried together, with the
+    variable name each one is exposed under in generated code.
+    """
+    datasets = list_datasets()
+    aliases = dataset_aliases(datasets)
+    for dataset in datasets:
+        dataset["alias"] = aliases[dataset["dataset_id"]]
+    return {"datasets": datasets}
 
 
 @app.post("/ask_question/")
 async def ask_question(
     question: str = Form(...),
-    filename: str = Form(...),
-    confirm: bool = Form(False)
+    dataset_id: str = Form(...),
+    confirm: bool = Form(False),
+    profile: bool = Form(False),
+    result_id: Optional[str] = Form(None),
+    datasets: Optional[str] = Form(None)
 ):
     """
     Endpoint to ask a question about the uploaded CSV data.
-    If 'confirm' is False, it returns the count of query results.
-    If 'confirm' is True, it returns the final response.
+    If 'confirm' is False, it returns the count of query results and starts
+    generating the final response in the background under the returned 'result_id'.
+    If 'confirm' is True, it returns the final response; passing the 'result_id'
+    of the count step returns the background response for that query.
+    'datasets' optionally lists, comma separated, the ids of further datasets the
+    question may combine with this one.
+    If 'profile' is True, the execution of the generated code is profiled and the
+    hottest lines and peak memory are returned as 'profile'.
     """
-    logger.info(f"Received question: '{question}' for file: '{filename}', confirm={confirm}")
+    logger.info(f"Received question: '{question}' for dataset: '{dataset_id}', confirm={confirm}")
 
     # Load Data
-    df = load_csv(f"{DATA_DIR}/{filename}")
+    if not dataset_exists(dataset_id):
+        logger.error(f"Unknown dataset '{dataset_id}'.")
+        return JSONResponse(
+            content={"error": f"Dataset '{dataset_id}' not found."},
+            status_code=404,
+        )
+    catalog = build_catalog([d for d in (datasets or "").split(",") if d and d != dataset_id])
+    if catalog is None:
+        logger.error(f"Unknown dataset in '{datasets}'.")
+        return JSONResponse(
+            content={"error": f"One of the datasets '{datasets}' was not found."},
+            status_code=404,
+        )
+    speculation_key = (dataset_id, tuple(catalog.values()), question)
+
+    # Use the response speculatively generated after the count step, unless the
+    # execution has to be profiled here
+    speculative = take_speculation(result_id, speculation_key) if confirm and result_id else None
+    if speculative is not None and profile:
+        speculative.cancel()
+    elif speculative is not None:
+        try:
+            final_response = await speculative
+            logger.info("Returning speculatively generated response.")
+            return {"response": final_response, "result_id": result_id}
+        except Exception as e:
+            logger.warning(f"Speculative response failed, generating it again: {e}")
+
+    # Parsing and indexing a dataset takes seconds on large files; keep the event loop free
+    df, index = await asyncio.to_thread(load_dataset, dataset_id)
     if df is None:
         logger.error("Failed to load dataframe.")
         return JSONResponse(
@@ -75,34 +329,14 @@ async def ask_question(
     # Extract Schema
     schema = extract_schema(df)
     data_dictionary = extract_data_dictionary(df)
-    # Generate Summary
-    summary = generate_summary(df)
 
     if not confirm:
-        # Generate Pandas Query
-        pandas_query = generate_pandas_query(question, schema, data_dictionary)
-
-        if not pandas_query:
-            logger.error("Failed to generate a valid pandas query.")
-            return JSONResponse(
-                content={"error": "Failed to generate a valid pandas query."},
-                status_code=400,
-            )
-
-        # Execute Query
-        _vars = {"df": df, 'query_result': None}
+        # Generate and execute the pandas query
+        profile_report = {} if profile else None
         try:
-            exec(pandas_query, _vars)
-            query_result = _vars.get('query_result', None)
-            if query_result is None:
-                raise ValueError("The generated query did not assign a value to 'query_result'.")
-            
-            # Determine the count based on the type of query_result
-            if isinstance(query_result, (pd.DataFrame, list, dict, set, tuple)):
-                count = len(query_result)
-            else:
-                count = 1  # For scalar results
-            logger.info(f"Number of query results: {count}")
+            pandas_query, query_result = await run_query(
+                question, schema, data_dictionary, df, index, dataset_id, catalog, profile_report
+            )
         except Exception as e:
             logger.error(f"Failed to execute query: {e}")
             return JSONResponse(
@@ -110,11 +344,6 @@ async def ask_question(
                 status_code=400,
             )
 
-        return {"count": count}
-    else:
-        # Generate Pandas Query
-        pandas_query = generate_pandas_query(question, schema, data_dictionary)
-
         if not pandas_query:
             logger.error("Failed to generate a valid pandas query.")
             return JSONResponse(
@@ -122,14 +351,32 @@ async def ask_question(
                 status_code=400,
             )
 
-        # Execute Query
-        _vars = {"df": df, 'query_result': None}
+        # Determine the count based on the type of query_result
+        if isinstance(query_result, (pd.DataFrame, list, dict, set, tuple)):
+            count = len(query_result)
+        else:
+            count = 1  # For scalar results
+        logger.info(f"Number of query results: {count}")
+
+        result_id = store_result(query_result)
+        response_key = flight_key("response", dataset_id, catalog, question, pandas_query)
+        # The user nearly always confirms next; prepare the final response while they read the count
+        start_speculation(
+            result_id,
+            speculation_key,
+            lambda: coalesced(response_key, lambda: build_final_response(question, pandas_query, query_result, df)),
+        )
+        response = {"count": count, "result_id": result_id}
+        if profile:
+            response["profile"] = profile_report
+        return response
+    else:
+        # Generate and execute the pandas query
+        profile_report = {} if profile else None
         try:
-            exec(pandas_query, _vars)
-            query_result = _vars.get('query_result', None)
-            if query_result is None:
-                raise ValueError("The generated query did not assign a value to 'query_result'.")
-            logger.info("Successfully executed pandas query.")
+            pandas_query, query_result = await run_query(
+                question, schema, data_dictionary, df, index, dataset_id, catalog, profile_report
+            )
         except Exception as e:
             logger.error(f"Failed to execute query: {e}")
             return JSONResponse(
@@ -137,29 +384,84 @@ async def ask_question(
                 status_code=400,
             )
 
+        if not pandas_query:
+            logger.error("Failed to generate a valid pandas query.")
+            return JSONResponse(
+                content={"error": "Failed to generate a valid pandas query."},
+                status_code=400,
+            )
+        logger.info("Successfully executed pandas query.")
+
         # Generate Final Response
-        final_response = generate_final_response(question, query_result, summary)
+        response_key = flight_key("response", dataset_id, catalog, question, pandas_query)
+        final_response = await asyncio.to_thread(
+            coalesced, response_key, lambda: build_final_response(question, pandas_query, query_result, df)
+        )
 
         logger.info(f"Generated response: {final_response}")
 
-        return {"response": final_response}
+        result_id = store_result(query_result)
+        response = {"response": final_response, "result_id": result_id}
+        if profile:
+            response["profile"] = profile_report
+        return response
 
 
 @app.post("/visualize/")
 async def visualize(
     question: str = Form(...), 
-    filename: str = Form(...), 
-    confirm: bool = Form(False)
+    dataset_id: str = Form(...), 
+    confirm: bool = Form(False),
+    profile: bool = Form(False),
+    result_id: Optional[str] = Form(None),
+    datasets: Optional[str] = Form(None)
 ):
     """
     Endpoint to generate a Plotly visualization based on the user's question.
-    If 'confirm' is False, it returns the count of the data to be visualized.
-    If 'confirm' is True, it returns the final Plotly JSON.
+    If 'confirm' is False, it returns the count of the data to be visualized and
+    starts generating the figure in the background under the returned 'result_id'.
+    If 'confirm' is True, it returns the final Plotly JSON; passing the 'result_id'
+    of the count step returns the background figure.
+    'datasets' optionally lists, comma separated, the ids of further datasets the
+    query may combine with this one.
+    If 'profile' is True, the execution of the generated code is profiled and the
+    hottest lines and peak memory are returned as 'profile'.
     """
-    logger.info(f"Received visualization request: '{question}' for file: '{filename}', confirm={confirm}")
+    logger.info(f"Received visualization request: '{question}' for dataset: '{dataset_id}', confirm={confirm}")
 
     # Load Data
-    df = load_csv(f"{DATA_DIR}/{filename}")
+    if not dataset_exists(dataset_id):
+        logger.error(f"Unknown dataset '{dataset_id}'.")
+        return JSONResponse(
+            content={"error": f"Dataset '{dataset_id}' not found."},
+            status_code=404,
+        )
+    catalog = build_catalog([d for d in (datasets or "").split(",") if d and d != dataset_id])
+    if catalog is None:
+        logger.error(f"Unknown dataset in '{datasets}'.")
+        return JSONResponse(
+            content={"error": f"One of the datasets '{datasets}' was not found."},
+            status_code=404,
+        )
+    speculation_key = (dataset_id, tuple(catalog.values()), question)
+
+    # Use the figure speculatively generated after the count step, unless the
+    # execution has to be profiled here
+    speculative = take_speculation(result_id, speculation_key) if confirm and result_id else None
+    if speculative is not None and profile:
+        speculative.cancel()
+    elif speculative is not None:
+        try:
+            _, plotly_json = await speculative
+        except Exception as e:
+            logger.warning(f"Speculative visualization failed, generating it again: {e}")
+            plotly_json = None
+        if plotly_json:
+            logger.info("Returning speculatively generated Plotly JSON.")
+            return JSONResponse(content={"plotly_json": plotly_json})
+
+    # Parsing and indexing a dataset takes seconds on large files; keep the event loop free
+    df, index = await asyncio.to_thread(load_dataset, dataset_id)
 
     if df is None:
         logger.error("Failed to load dataframe.")
@@ -171,33 +473,15 @@ async def visualize(
     # Extract Schema
     schema = extract_schema(df)
     data_dictionary = extract_data_dictionary(df)
+    plot_key = flight_key("plot", dataset_id, catalog, question)
     # If not confirm, just return the count of the query results
     if not confirm:
-        # Generate Pandas Query
-        pandas_query = generate_pandas_query(question, schema, data_dictionary)
-
-        if not pandas_query:
-            logger.error("Failed to generate a valid pandas query.")
-            return JSONResponse(
-                content={"error": "Failed to generate a valid pandas query."},
-                status_code=400,
-            )
-
-        # Execute Query
-        _vars = {"df": df, 'query_result': None}
+        # Generate and execute the pandas query
+        profile_report = {} if profile else None
         try:
-            exec(pandas_query, _vars)
-            query_result = _vars.get('query_result', None)
-            if query_result is None:
-                raise ValueError("The generated query did not assign a value to 'query_result'.")
-
-            # Determine the count
-            if isinstance(query_result, (pd.DataFrame, list, dict, set, tuple)):
-                count = len(query_result)
-            else:
-                count = 1  # For scalar results
-            logger.info(f"Number of query results for visualization: {count}")
-
+            pandas_query, query_result = await run_query(
+                question, schema, data_dictionary, df, index, dataset_id, catalog, profile_report
+            )
         except Exception as e:
             logger.error(f"Failed to execute query: {e}")
             return JSONResponse(
@@ -205,10 +489,42 @@ async def visualize(
                 status_code=400,
             )
 
-        return {"count": count}
+        if not pandas_query:
+            logger.error("Failed to generate a valid pandas query.")
+            return JSONResponse(
+                content={"error": "Failed to generate a valid pandas query."},
+                status_code=400,
+            )
+
+        # Determine the count
+        if isinstance(query_result, (pd.DataFrame, list, dict, set, tuple)):
+            count = len(query_result)
+        else:
+            count = 1  # For scalar results
+        logger.info(f"Number of query results for visualization: {count}")
+
+        result_id = store_result(query_result)
+        # The user nearly always confirms next; build the figure while they read the count
+        start_speculation(
+            result_id,
+            speculation_key,
+            lambda: coalesced(plot_key, lambda: build_plotly_json(question, schema, df, index)),
+        )
+        response = {"count": count, "result_id": result_id}
+        if profile:
+            response["profile"] = profile_report
+        return response
     else:
         # If confirm=True, generate the final Plotly visualization
-        plotly_code = generate_plotly_code(question, schema)
+        if profile:
+            profile_report = {}
+            plotly_code, plotly_json = await asyncio.to_thread(
+                build_plotly_json, question, schema, df, index, profile_report
+            )
+        else:
+            plotly_code, plotly_json = await asyncio.to_thread(
+                coalesced, plot_key, lambda: build_plotly_json(question, schema, df, index)
+            )
 
         if not plotly_code:
             logger.error("Failed to generate Plotly code.")
@@ -217,8 +533,6 @@ async def visualize(
                 status_code=400,
             )
 
-        plotly_json = get_plotly_json(plotly_code, df)
-
         if not plotly_json:
             logger.error("Failed to generate Plotly JSON.")
             return JSONResponse(
@@ -227,7 +541,102 @@ async def visualize(
             )
 
         logger.info("Plotly JSON generated successfully.")
-        return JSONResponse(content={"plotly_json": plotly_json})
+        content = {"plotly_json": plotly_json}
+        if profile:
+            content["profile"] = profile_report
+        return JSONResponse(content=content)
+
+
+@app.delete("/speculations/{result_id}")
+async def cancel_confirm_step(result_id: str):
+    """
+    Endpoint to drop the background confirm-step work started for a count result,
+    e.g. when the user asks for another query instead of continuing.
+    """
+    return {"cancelled": cancel_speculation(result_id)}
+
+
+@app.get("/metrics/")
+async def get_metrics():
+    """
+    Endpoint reporting how much work the backend avoided or spent: coalesced
+    requests, questions answered without the LLM, prompt tokens saved by pruned
+    dataset summaries, result cache, speculative confirm steps and the slowest
+    profiled lines.
+    """
+    return {
+        "coalescing": coalescing_stats(),
+        "intent_matcher": intent_stats(),
+        "summary": summary_stats(),
+        "result_cache": cache_stats(),
+        "speculation": speculation_stats(),
+        "profiler": {"top_offenders": top_offenders()},
+    }
+
+
+@app.get("/results/{result_id}")
+async def download_result(
+    result_id: str,
+    fmt: str = Query("json", alias="format"),
+    columns: Optional[str] = None,
+    start: int = Query(0, ge=0),
+    stop: Optional[int] = Query(None, ge=0),
+    page_size: int = Query(1000, ge=1, le=100000),
+):
+    """
+    Endpoint to download the rows of a stored query result.
+    'columns' is a comma separated projection and [start, stop) the row range.
+    The 'json' format returns one page of at most 'page_size' rows along with the
+    start of the next page; 'ndjson', 'arrow' and 'parquet' stream the whole
+    range in batches of 'page_size' rows.
+    """
+    if fmt not in DOWNLOAD_FORMATS:
+        return JSONResponse(
+            content={"error": f"Unsupported format '{fmt}'. Use one of: {', '.join(DOWNLOAD_FORMATS)}."},
+            status_code=400,
+        )
+
+    try:
+        frame = get_result(result_id, columns.split(",") if columns else None)
+    except KeyError as e:
+        return JSONResponse(content={"error": e.args[0]}, status_code=400)
+    if frame is None:
+        return JSONResponse(
+            content={"error": f"Result '{result_id}' not found or expired."},
+            status_code=404,
+        )
+
+    total_rows = len(frame)
+    frame = frame.iloc[start:stop]
+    logger.info(f"Serving result '{result_id}' as {fmt}: rows {start}-{start + len(frame)} of {total_rows}")
+
+    if fmt == "json":
+        page = frame.iloc[:page_size]
+        next_start = start + len(page) if len(page) < len(frame) else None
+        return {
+            "result_id": result_id,
+            "total_rows": total_rows,
+            "start": start,
+            "columns": list(page.columns),
+            "rows": json.loads(page.to_json(orient="records", date_format="iso")),
+            "next_start": next_start,
+        }
+
+    # Fails before any byte is sent if the result has no Arrow representation
+    try:
+        chunks = STREAM_WRITERS[fmt](frame, page_size)
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        logger.error(f"Result '{result_id}' cannot be written as {fmt}: {e}")
+        return JSONResponse(
+            content={"error": f"Result cannot be downloaded as {fmt}: {e}"},
+            status_code=400,
+        )
+
+    return StreamingResponse(
+        chunks,
+        media_type=DOWNLOAD_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{result_id}.{fmt}"'},
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+# benchmarks/load_csv_benchmark.py
+
+import os
+import sys
+import gzip
+import time
+import argparse
+import tempfile
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.data_loader import load_csv
+
+
+def scale_up(source, target, copies):
+    """
+    Writes 'copies' repetitions of the rows of 'source' to 'target', plain and gzip-compressed,
+    with an added "SaleDate" column so the re-read of temporal columns is measured too.
+    """
+    df = pd.concat([pd.read_csv(source)] * copies, ignore_index=True)
+    df["SaleDate"] = (pd.Timestamp("2006-01-01") + pd.to_timedelta(df.index % 1826, unit="D")).strftime("%Y-%m-%d")
+    df.to_csv(target, index=False)
+    with open(target, "rb") as plain, gzip.open(target + ".gz", "wb", compresslevel=1) as compressed:
+        compressed.write(plain.read())
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare load_csv with the single-threaded pandas parser.")
+    parser.add_argument("--source", default="data/test_sample.csv", help="CSV file to scale up")
+    parser.add_argument("--copies", type=int, default=1000, help="Number of times the rows are repeated")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        target = os.path.join(directory, "scaled.csv")
+        scale_up(args.source, target, args.copies)
+        print(f"{args.copies}x {args.source}: {os.path.getsize(target) / 2 ** 20:.0f} MiB, "
+              f"{pa.cpu_count()} parse threads")
+
+        for path in (target, target + ".gz"):
+            baseline = best_of(args.repeat, lambda: pd.read_csv(path))
+            threaded = best_of(args.repeat, lambda: load_csv(path))
+            print(f"{os.path.basename(path):14} pandas {baseline:6.2f}s   load_csv {threaded:6.2f}s   "
+                  f"speedup {baseline / threaded:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
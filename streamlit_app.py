@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import plotly.io as pio
 import json
+import hashlib
 
 # Set the backend API URL
 API_URL = 'http://localhost:8000'  # Change this if your backend is hosted elsewhere
@@ -9,10 +10,16 @@ API_URL = 'http://localhost:8000'  # Change this if your backend is hosted elsew
 st.set_page_config(page_title="Data Analysis App", layout="wide")
 st.title("📊 Data Analysis App")
 
-# Initialize session state for uploaded filename and question state
+# Initialize session state for uploaded dataset and question state
 if 'uploaded_filename' not in st.session_state:
     st.session_state.uploaded_filename = None
 
+if 'dataset_id' not in st.session_state:
+    st.session_state.dataset_id = None
+
+if 'upload_key' not in st.session_state:
+    st.session_state.upload_key = None
+
 if 'question_step' not in st.session_state:
     st.session_state.question_step = 0
 
@@ -22,6 +29,9 @@ if 'current_question' not in st.session_state:
 if 'query_count' not in st.session_state:
     st.session_state.query_count = 0
 
+if 'result_id' not in st.session_state:
+    st.session_state.result_id = None
+
 if 'visualization_step' not in st.session_state:
     st.session_state.visualization_step = 0
 
@@ -31,32 +41,104 @@ if 'current_viz_question' not in st.session_state:
 if 'viz_query_count' not in st.session_state:
     st.session_state.viz_query_count = 0
 
+if 'viz_result_id' not in st.session_state:
+    st.session_state.viz_result_id = None
+
+
+def cancel_confirm_step(result_id):
+    """
+    Tells the backend to drop the answer it started preparing for a count result.
+    """
+    if result_id:
+        requests.delete(f"{API_URL}/speculations/{result_id}")
+
 
 # ----------------------------
 # File Upload Section
 # ----------------------------
+def upload_dataset(uploaded_file):
+    """
+    Uploads a file by its sha256 content id. Nothing is sent if the backend already
+    has the bytes; otherwise the file is sent in chunks, resuming from the offset
+    the backend reports. Returns (dataset_id, error).
+    """
+    content = uploaded_file.getvalue()
+    content_id = hashlib.sha256(content).hexdigest()
+
+    response = requests.post(f"{API_URL}/uploads/", data={'content_id': content_id})
+    if response.status_code != 200:
+        return None, response.json().get('error', 'Unknown error')
+    status = response.json()
+    if status.get('exists'):
+        return content_id, None
+
+    offset = status['offset']
+    chunk_size = status['chunk_size']
+    progress = st.progress(0.0)
+    while offset < len(content):
+        response = requests.put(
+            f"{API_URL}/uploads/{content_id}",
+            params={'offset': offset},
+            data=content[offset:offset + chunk_size],
+        )
+        if response.status_code == 409:
+            # The backend has a different amount of data; continue from its offset
+            offset = response.json()['offset']
+            continue
+        if response.status_code != 200:
+            return None, response.json().get('error', 'Unknown error')
+        offset = response.json()['offset']
+        progress.progress(min(offset / len(content), 1.0))
+
+    response = requests.post(f"{API_URL}/uploads/{content_id}/complete", data={'filename': uploaded_file.name})
+    if response.status_code != 200:
+        return None, response.json().get('error', 'Unknown error')
+    return response.json()['dataset_id'], None
+
+
 st.header("📥 Upload CSV File")
 
-uploaded_file = st.file_uploader("Choose a CSV file", type=["csv"])
+uploaded_file = st.file_uploader("Choose a CSV file", type=["csv", "gz", "zst", "bz2"])
 
 if uploaded_file is not None:
-    # Upload the file to the backend
-    files = {'file': (uploaded_file.name, uploaded_file.getvalue(), 'text/csv')}
-    with st.spinner("Uploading..."):
-        response = requests.post(f"{API_URL}/upload_csv/", files=files)
+    # Streamlit reruns the script on every interaction; only upload a file the backend has not seen yet
+    upload_key = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+    if st.session_state.upload_key != upload_key:
+        with st.spinner("Uploading..."):
+            dataset_id, error = upload_dataset(uploaded_file)
 
-    if response.status_code == 200:
+        if dataset_id:
+            st.session_state.dataset_id = dataset_id
+            st.session_state.uploaded_filename = uploaded_file.name
+            st.session_state.upload_key = upload_key
+        else:
+            st.error(f"⚠️ Failed to upload file. Error: {error}")
+
+    if st.session_state.upload_key == upload_key:
         st.success(f"✅ File '{uploaded_file.name}' uploaded successfully.")
-        st.session_state.uploaded_filename = uploaded_file.name
-    else:
-        st.error(f"⚠️ Failed to upload file. Error: {response.json().get('error', 'Unknown error')}")
+
+# Other uploaded datasets questions may combine with the current one (e.g. joins)
+if st.session_state.dataset_id:
+    response = requests.get(f"{API_URL}/datasets/")
+    other_datasets = {}
+    if response.status_code == 200:
+        for dataset in response.json().get('datasets', []):
+            if dataset['dataset_id'] != st.session_state.dataset_id:
+                other_datasets[dataset['dataset_id']] = f"{dataset.get('filename')} (as {dataset['alias']})"
+    if other_datasets:
+        st.multiselect(
+            "Also query these uploaded datasets",
+            options=list(other_datasets),
+            format_func=other_datasets.get,
+            key='related_datasets',
+        )
 
 # ----------------------------
 # Ask Question Section
 # ----------------------------
 st.header("❓ Ask a Question about Your Data")
 
-if st.session_state.uploaded_filename:
+if st.session_state.dataset_id:
     if st.session_state.question_step == 0:
         question = st.text_input("Enter your question", key="initial_question")
 
@@ -64,7 +146,8 @@ if st.session_state.uploaded_filename:
             with st.spinner("Processing your question..."):
                 data = {
                     'question': question,
-                    'filename': st.session_state.uploaded_filename,
+                    'dataset_id': st.session_state.dataset_id,
+                    'datasets': ','.join(st.session_state.get('related_datasets', [])),
                     'confirm': False
                 }
                 response = requests.post(f"{API_URL}/ask_question/", data=data)
@@ -73,12 +156,19 @@ if st.session_state.uploaded_filename:
                 count = response.json().get('count', 0)
                 st.session_state.current_question = question
                 st.session_state.query_count = count
+                st.session_state.result_id = response.json().get('result_id')
                 st.session_state.question_step = 1
             else:
                 st.error(f"⚠️ Error: {response.json().get('error', 'Unknown error')}")
     elif st.session_state.question_step == 1:
         count = st.session_state.query_count
         st.write(f"**Number of results:** {count}")
+        if st.session_state.result_id:
+            download_url = f"{API_URL}/results/{st.session_state.result_id}"
+            st.markdown(
+                f"⬇️ Download results: [Parquet]({download_url}?format=parquet) · "
+                f"[Arrow]({download_url}?format=arrow) · [NDJSON]({download_url}?format=ndjson)"
+            )
 
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -86,8 +176,10 @@ if st.session_state.uploaded_filename:
                 with st.spinner("Generating answer..."):
                     data = {
                         'question': st.session_state.current_question,
-                        'filename': st.session_state.uploaded_filename,
-                        'confirm': True
+                        'dataset_id': st.session_state.dataset_id,
+                        'datasets': ','.join(st.session_state.get('related_datasets', [])),
+                        'confirm': True,
+                        'result_id': st.session_state.result_id
                     }
                     response = requests.post(f"{API_URL}/ask_question/", data=data)
 
@@ -103,10 +195,12 @@ if st.session_state.uploaded_filename:
                     st.error(f"⚠️ Error: {response.json().get('error', 'Unknown error')}")
         with col2:
             if st.button("🔄 Try Another Query"):
+                cancel_confirm_step(st.session_state.result_id)
                 with st.spinner("Generating a new query..."):
                     data = {
                         'question': st.session_state.current_question,
-                        'filename': st.session_state.uploaded_filename,
+                        'dataset_id': st.session_state.dataset_id,
+                        'datasets': ','.join(st.session_state.get('related_datasets', [])),
                         'confirm': False
                     }
                     response = requests.post(f"{API_URL}/ask_question/", data=data)
@@ -114,10 +208,12 @@ if st.session_state.uploaded_filename:
                 if response.status_code == 200:
                     new_count = response.json().get('count', 0)
                     st.session_state.query_count = new_count
+                    st.session_state.result_id = response.json().get('result_id')
                 else:
                     st.error(f"⚠️ Error: {response.json().get('error', 'Unknown error')}")
         with col3:
             if st.button("🧐 Another Question"):
+                cancel_confirm_step(st.session_state.result_id)
                 st.write("You chose to give up on this query.")
                 st.session_state.question_step = 0
                 st.session_state.current_question = ''
@@ -129,7 +225,7 @@ else:
 # ----------------------------
 st.header("📈 Data Visualization")
 
-if st.session_state.uploaded_filename:
+if st.session_state.dataset_id:
     if st.session_state.visualization_step == 0:
         viz_question = st.text_input("Enter your visualization request")
 
@@ -137,7 +233,8 @@ if st.session_state.uploaded_filename:
             with st.spinner("Analyzing your visualization request..."):
                 data = {
                     'question': viz_question,
-                    'filename': st.session_state.uploaded_filename,
+                    'dataset_id': st.session_state.dataset_id,
+                    'datasets': ','.join(st.session_state.get('related_datasets', [])),
                     'confirm': False
                 }
                 response = requests.post(f"{API_URL}/visualize/", data=data)
@@ -146,6 +243,7 @@ if st.session_state.uploaded_filename:
                 count = response.json().get('count', 0)
                 st.session_state.current_viz_question = viz_question
                 st.session_state.viz_query_count = count
+                st.session_state.viz_result_id = response.json().get('result_id')
                 st.session_state.visualization_step = 1
             else:
                 st.error(f"⚠️ Error: {response.json().get('error', 'Unknown error')}")
@@ -159,8 +257,10 @@ if st.session_state.uploaded_filename:
                 with st.spinner("Generating visualization..."):
                     data = {
                         'question': st.session_state.current_viz_question,
-                        'filename': st.session_state.uploaded_filename,
-                        'confirm': True
+                        'dataset_id': st.session_state.dataset_id,
+                        'datasets': ','.join(st.session_state.get('related_datasets', [])),
+                        'confirm': True,
+                        'result_id': st.session_state.viz_result_id
                     }
                     response = requests.post(f"{API_URL}/visualize/", data=data)
 
@@ -182,10 +282,12 @@ if st.session_state.uploaded_filename:
                     st.error(f"⚠️ Error: {response.json().get('error', 'Unknown error')}")
         with col2:
             if st.button("🔄 Try Another Query"):
+                cancel_confirm_step(st.session_state.viz_result_id)
                 with st.spinner("Generating a new query..."):
                     data = {
                         'question': st.session_state.current_viz_question,
-                        'filename': st.session_state.uploaded_filename,
+                        'dataset_id': st.session_state.dataset_id,
+                        'datasets': ','.join(st.session_state.get('related_datasets', [])),
                         'confirm': False
                     }
                     response = requests.post(f"{API_URL}/visualize/", data=data)
@@ -193,10 +295,12 @@ if st.session_state.uploaded_filename:
                 if response.status_code == 200:
                     new_count = response.json().get('count', 0)
                     st.session_state.viz_query_count = new_count
+                    st.session_state.viz_result_id = response.json().get('result_id')
                 else:
                     st.error(f"⚠️ Error: {response.json().get('error', 'Unknown error')}")
         with col3:
             if st.button("🧐 Another Visualization"):
+                cancel_confirm_step(st.session_state.viz_result_id)
                 st.write("You chose to give up on this visualization query.")
                 st.session_state.visualization_step = 0
                 st.session_state.current_viz_question = ''
@@ -0,0 +1,100 @@
+# utils/catalog.py
+
+import os
+import re
+import logging
+import pandas as pd
+from rich.console import Console
+from utils.data_loader import detect_compression
+from utils.dataset_store import dataset_exists, dataset_metadata, dataset_path, list_datasets
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+# Rows read to infer the column types of a dataset for its summary
+SCHEMA_SAMPLE_ROWS = 1000
+# Example values listed for text columns
+EXAMPLE_VALUES = 5
+
+# Extensions of compressed uploads, dropped along with '.csv' when naming a dataset
+_COMPRESSED_EXTENSIONS = {".gz", ".zst", ".bz2"}
+
+# content id -> summary; datasets never change under their content id
+_summaries = {}
+
+
+def dataset_alias(filename):
+    """
+    Variable name a dataset is exposed under in generated code, e.g. 'sales 2024.csv' -> 'df_sales_2024'.
+    """
+    stem, extension = os.path.splitext(os.path.basename(filename or ""))
+    if extension.lower() in _COMPRESSED_EXTENSIONS:
+        stem = os.path.splitext(stem)[0]
+    name = re.sub(r"\W+", "_", stem).strip("_").lower() or "data"
+    return f"df_{name}"
+
+
+def dataset_aliases(datasets=None):
+    """
+    Maps every stored dataset id (or those of 'datasets', as returned by list_datasets)
+    to a unique alias. Datasets whose file names give the same alias are numbered in
+    upload order ('df_sales', 'df_sales_2'), so an alias does not change when other
+    datasets are selected or uploaded later.
+    """
+    if datasets is None:
+        datasets = list_datasets()
+    ordered = sorted(
+        datasets,
+        key=lambda dataset: (os.path.getmtime(dataset_path(dataset["dataset_id"])), dataset["dataset_id"]),
+    )
+    aliases = {}
+    taken = set()
+    for dataset in ordered:
+        alias = base = dataset_alias(dataset.get("filename"))
+        suffix = 2
+        while alias in taken:
+            alias, suffix = f"{base}_{suffix}", suffix + 1
+        taken.add(alias)
+        aliases[dataset["dataset_id"]] = alias
+    return aliases
+
+
+def build_catalog(dataset_ids):
+    """
+    Maps the alias of each of the given dataset ids to the id, or returns None if one of them does not exist.
+    """
+    if not all(dataset_exists(content_id) for content_id in dataset_ids):
+        return None
+    aliases = dataset_aliases()
+    if not all(content_id in aliases for content_id in dataset_ids):
+        return None
+    return {aliases[content_id]: content_id for content_id in dataset_ids}
+
+
+def summarize_dataset(content_id):
+    """
+    Short schema summary of a dataset, inferred from its first rows without loading all of it.
+    """
+    if content_id not in _summaries:
+        path = dataset_path(content_id)
+        sample = pd.read_csv(path, nrows=SCHEMA_SAMPLE_ROWS, compression=detect_compression(path))
+        columns = []
+        for column in sample.columns:
+            description = f"{column} ({sample[column].dtype})"
+            if pd.api.types.is_string_dtype(sample[column]):
+                examples = sample[column].dropna().unique()[:EXAMPLE_VALUES]
+                description += f" e.g. {', '.join(map(str, examples))}"
+            columns.append(description)
+        _summaries[content_id] = "; ".join(columns)
+    return _summaries[content_id]
+
+
+def catalog_prompt(catalog):
+    """
+    Prompt section describing the datasets of the catalog, one line per dataset.
+    """
+    lines = []
+    for alias, content_id in catalog.items():
+        filename = dataset_metadata(content_id).get("filename", "")
+        lines.append(f"{alias} (file '{filename}'): {summarize_dataset(content_id)}")
+    return "\n".join(lines)
@@ -0,0 +1,64 @@
+# utils/coalescer.py
+
+import re
+import threading
+import logging
+from concurrent.futures import Future
+from rich.console import Console
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+# key -> Future of the computation currently running for it
+_in_flight = {}
+_lock = threading.Lock()
+_stats = {"executed": 0, "coalesced": 0}
+
+
+def normalize_question(question):
+    """
+    Lowercases a question and collapses whitespace and trailing punctuation, so
+    'How many rows?' and 'how many  rows' coalesce.
+    """
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.! ").lower()
+
+
+def coalesced(key, func):
+    """
+    Calls 'func' and returns its result, unless a call for the same 'key' is already
+    running; then waits for that call and returns its result (or raises its exception).
+    Blocks, so it is meant to run in a worker thread. Results are shared between the
+    callers and must not be modified.
+    """
+    with _lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+            _stats["executed"] += 1
+        else:
+            _stats["coalesced"] += 1
+
+    if not leader:
+        logger.info(f"Joining in-flight computation for {key}")
+        return future.result()
+
+    try:
+        result = func()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _lock:
+            del _in_flight[key]
+
+
+def coalescing_stats():
+    """
+    Computations run and calls saved by joining one already in flight.
+    """
+    with _lock:
+        return {**_stats, "in_flight": len(_in_flight)}
@@ -0,0 +1,629 @@
+# utils/code_analyzer.py
+
+import ast
+import builtins
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import pandas as pd
+from rich.console import Console
+from utils.column_index import make_indexed_filter
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+# Names the generated code may read without assigning them first
+QUERY_NAMES = frozenset({"df", "pd", "np", "query_result"})
+PLOTLY_NAMES = frozenset({"df", "pd", "np", "px", "go", "pio", "fig"})
+
+# Imports the LLM tends to add anyway; the modules are already provided in the namespace
+_PROVIDED_IMPORTS = {
+    "pandas": "pd",
+    "numpy": "np",
+    "plotly.express": "px",
+    "plotly.graph_objects": "go",
+    "plotly.io": "pio",
+}
+
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in (
+        "abs", "all", "any", "bool", "dict", "enumerate", "filter", "float", "int",
+        "isinstance", "len", "list", "map", "max", "min", "print", "range", "reversed",
+        "round", "set", "slice", "sorted", "str", "sum", "tuple", "zip",
+        "Exception", "KeyError", "ValueError", "TypeError",
+    )
+}
+
+_FORBIDDEN_NODES = (
+    ast.ClassDef, ast.AsyncFunctionDef, ast.Global, ast.Nonlocal,
+    ast.Await, ast.Yield, ast.YieldFrom,
+)
+
+# Methods returning a boolean Series, i.e. usable as a row mask
+_MASK_METHODS = {
+    "isin", "between", "isna", "isnull", "notna", "notnull",
+    "contains", "startswith", "endswith", "duplicated",
+}
+
+# Methods of a dataframe / Series that return another one with the same kind of rows
+_FRAME_METHODS = {
+    "head", "tail", "sort_values", "sort_index", "dropna", "fillna", "query", "copy",
+    "reset_index", "drop", "assign", "merge", "join", "nlargest", "nsmallest", "sample",
+    "astype", "rename", "drop_duplicates", "set_index", "select_dtypes", "filter",
+}
+_SERIES_METHODS = _FRAME_METHODS | {"map", "apply", "round", "abs", "lower", "upper", "strip", "replace"}
+# Yield one item per row of the dataframe or Series they are called on
+_ROW_ATTRS = {"index", "values", "array"}
+_ROW_METHODS = {"to_numpy", "tolist", "to_list", "iterrows", "itertuples"}
+# Builtins that iterate over their argument row by row
+_ROW_WRAPPERS = {"enumerate", "zip", "list", "sorted", "reversed"}
+
+# File name generated code is compiled under, used to find its frames when profiling
+GENERATED_FILENAME = "<generated>"
+
+# Name of the function index-rewritten filters call; see utils/column_index.py
+INDEX_FILTER = "_indexed_filter"
+
+# Analyzed and compiled snippets kept, keyed on their source text
+MAX_PREPARED_CODE = 256
+_prepared = OrderedDict()
+_prepared_lock = threading.Lock()
+
+# Methods that modify a dataframe in place
+_MUTATING_METHODS = {"insert", "pop", "update"}
+
+_FLIPPED_OPS = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+_COMPARE_OPS = {
+    ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=",
+}
+
+_VECTORIZABLE_BINOPS = (
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.BitAnd, ast.BitOr, ast.BitXor,
+)
+
+
+class CodeAnalysisError(ValueError):
+    """
+    Raised when generated code uses a name or construct that is not allowed,
+    or a slow pattern that could not be rewritten.
+    """
+
+
+def _references_df(node):
+    return any(isinstance(n, ast.Name) and n.id == "df" for n in ast.walk(node))
+
+
+def _is_mask(node):
+    if isinstance(node, ast.Compare):
+        return True
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr, ast.BitXor)):
+        return _is_mask(node.left) and _is_mask(node.right)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+        return _is_mask(node.operand)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        return node.func.attr in _MASK_METHODS
+    return False
+
+
+def _iteration_kind(node):
+    """
+    What iterating over 'node' steps through, as far as it can be told statically:
+    "frame" (a dataframe: its columns), "series" and "rows" (one step per row), or
+    None (columns, distinct values, groups, or unknown).
+    """
+    if isinstance(node, ast.Name):
+        return "frame" if node.id == "df" or node.id.startswith("df_") else None
+    if isinstance(node, ast.Subscript):
+        kind = _iteration_kind(node.value)
+        if kind == "frame":
+            column = node.slice.elts[-1] if isinstance(node.slice, ast.Tuple) and node.slice.elts else node.slice
+            if isinstance(column, ast.Constant) and isinstance(column.value, str):
+                return "series"  # df["col"] or df.loc[mask, "col"]
+            return "frame"
+        if kind == "series" and not isinstance(node.slice, ast.Constant):
+            return "series"
+        return None
+    if isinstance(node, ast.Attribute):
+        if node.attr in ("loc", "iloc"):
+            return _iteration_kind(node.value)
+        kind = _iteration_kind(node.value)
+        if kind in ("frame", "series") and node.attr in _ROW_ATTRS:
+            return "rows"
+        if kind == "frame" and not hasattr(pd.DataFrame, node.attr):
+            return "series"  # df.column
+        if kind == "series" and node.attr in ("str", "dt"):
+            return "series"
+        return None
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        kind = _iteration_kind(node.func.value)
+        method = node.func.attr
+        if kind in ("frame", "series", "rows") and method in _ROW_METHODS:
+            return "rows"
+        if kind == "series" and method == "items":
+            return "rows"
+        if kind == "frame" and method in _FRAME_METHODS:
+            return "frame"
+        if kind == "series" and method in _SERIES_METHODS:
+            return "series"
+        return None
+    return None
+
+
+def _is_row_iteration(node):
+    """
+    Whether a loop or comprehension over 'node' provably steps through the rows of
+    a dataframe, e.g. `range(len(df))`, `df.index`, `df["col"]` or `.values`.
+    Iterating over a dataframe itself (its columns), unique values or groups is fine.
+    """
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        if node.func.id == "range":
+            return any(_references_df(arg) for arg in node.args)
+        if node.func.id in _ROW_WRAPPERS:
+            return any(_is_row_iteration(arg) for arg in node.args)
+    return _iteration_kind(node) in ("series", "rows")
+
+
+def _vectorize_row_lambda(frame, func):
+    """
+    Turns `frame.apply(lambda row: row["a"] + row["b"], axis=1)` into
+    `frame["a"] + frame["b"]`. Returns None if the lambda body is not a plain
+    arithmetic/comparison expression over the row's fields.
+    """
+    if not isinstance(func, ast.Lambda) or len(func.args.args) != 1:
+        return None
+    row = func.args.args[0].arg
+
+    def convert(node):
+        if isinstance(node, ast.Constant):
+            return node
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == row:
+            if isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+                return ast.Subscript(value=frame, slice=node.slice, ctx=ast.Load())
+            return None
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == row:
+            # row.name, row.size etc. are Series attributes, not fields
+            if hasattr(pd.Series, node.attr):
+                return None
+            return ast.Subscript(value=frame, slice=ast.Constant(node.attr), ctx=ast.Load())
+        if isinstance(node, ast.BinOp) and isinstance(node.op, _VECTORIZABLE_BINOPS):
+            left, right = convert(node.left), convert(node.right)
+            if left is None or right is None:
+                return None
+            return ast.BinOp(left=left, op=node.op, right=right)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd, ast.Invert)):
+            operand = convert(node.operand)
+            return None if operand is None else ast.UnaryOp(op=node.op, operand=operand)
+        if isinstance(node, ast.Compare) and len(node.ops) == 1:
+            left, right = convert(node.left), convert(node.comparators[0])
+            if left is None or right is None:
+                return None
+            return ast.Compare(left=left, ops=node.ops, comparators=[right])
+        return None
+
+    return convert(func.body)
+
+
+class _SlowPatternRewriter(ast.NodeTransformer):
+    """
+    Rewrites known slow pandas patterns into vectorized equivalents and raises
+    CodeAnalysisError for the ones that have no mechanical rewrite.
+    """
+
+    def __init__(self):
+        self.rewrites = []
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if _PROVIDED_IMPORTS.get(alias.name) != (alias.asname or alias.name):
+                raise CodeAnalysisError(f"Importing '{alias.name}' is not allowed.")
+        return None
+
+    def visit_ImportFrom(self, node):
+        raise CodeAnalysisError(f"Importing from '{node.module}' is not allowed.")
+
+    def visit_For(self, node):
+        if _is_row_iteration(node.iter):
+            raise CodeAnalysisError(
+                "Python loops over the dataframe rows are not allowed; use vectorized column operations, "
+                "boolean masks or groupby instead."
+            )
+        return self.generic_visit(node)
+
+    def visit_comprehension(self, node):
+        if _is_row_iteration(node.iter):
+            raise CodeAnalysisError(
+                "Comprehensions over the dataframe rows are not allowed; use vectorized column operations instead."
+            )
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        if node.attr.startswith("__"):
+            raise CodeAnalysisError(f"Access to attribute '{node.attr}' is not allowed.")
+        return self.generic_visit(node)
+
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        # df[mask1][mask2] -> df[(mask1) & (mask2)]
+        inner = node.value
+        if isinstance(inner, ast.Subscript) and _is_mask(inner.slice) and _is_mask(node.slice):
+            self.rewrites.append("chained boolean indexing")
+            return ast.Subscript(
+                value=inner.value,
+                slice=ast.BinOp(left=inner.slice, op=ast.BitAnd(), right=node.slice),
+                ctx=node.ctx,
+            )
+        return node
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.func, ast.Attribute):
+            return node
+        method = node.func.attr
+        receiver = node.func.value
+
+        if method in ("iterrows", "itertuples"):
+            raise CodeAnalysisError(
+                f"'{method}()' is not allowed; use vectorized column operations instead."
+            )
+
+        if method == "apply":
+            axis = next((kw.value for kw in node.keywords if kw.arg == "axis"), None)
+            if isinstance(axis, ast.Constant) and axis.value in (1, "columns"):
+                func = node.args[0] if node.args else None
+                vectorized = _vectorize_row_lambda(receiver, func)
+                if vectorized is None:
+                    raise CodeAnalysisError(
+                        "Row-wise 'apply(..., axis=1)' is not allowed; express the computation with "
+                        "vectorized column arithmetic, np.where or Series.map instead."
+                    )
+                self.rewrites.append("row-wise apply")
+                return vectorized
+
+        # A deep copy of the whole frame is never needed: pandas runs with Copy-on-Write
+        if method == "copy" and isinstance(receiver, ast.Name) and receiver.id == "df" and not node.args:
+            deep = next((kw.value for kw in node.keywords if kw.arg == "deep"), None)
+            if deep is None or (isinstance(deep, ast.Constant) and deep.value is True):
+                self.rewrites.append("full frame copy")
+                return ast.Call(
+                    func=node.func,
+                    args=[],
+                    keywords=[ast.keyword(arg="deep", value=ast.Constant(False))],
+                )
+        return node
+
+
+def _root_name(node):
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _mutates_df(tree):
+    """
+    Whether the code may change 'df' itself, in which case its rows no longer
+    match the precomputed column index. Rebinding the name counts too, including
+    function and lambda parameters and loop or comprehension targets called 'df'.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == "df" and not isinstance(node.ctx, ast.Load):
+            return True
+        if isinstance(node, ast.arg) and node.arg == "df":
+            return True
+        if isinstance(node, ast.ExceptHandler) and node.name == "df":
+            return True
+        if isinstance(node, (ast.Subscript, ast.Attribute)) and not isinstance(node.ctx, ast.Load):
+            if _root_name(node) == "df":
+                return True
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and _root_name(node.func) == "df":
+            if node.func.attr in _MUTATING_METHODS:
+                return True
+            if any(kw.arg == "inplace" for kw in node.keywords):
+                return True
+    return False
+
+
+def _indexed_column(node):
+    """
+    Column name of `df["col"]` or `df.col`, else None.
+    """
+    if not isinstance(node, (ast.Subscript, ast.Attribute)):
+        return None
+    if not (isinstance(node.value, ast.Name) and node.value.id == "df"):
+        return None
+    if isinstance(node, ast.Attribute):
+        # df.count is the method even if there is a "count" column
+        return None if hasattr(pd.DataFrame, node.attr) else node.attr
+    if isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, (str, int)):
+        return node.slice.value
+    return None
+
+
+def _literal(node):
+    try:
+        value = ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None, False
+    return value, True
+
+
+def _filter_conditions(mask):
+    """
+    Decomposes a mask made of `&`-combined comparisons, isin() and between() calls
+    on df columns against literals into (column, op, value) conditions.
+    Returns None if any part of the mask has another shape.
+    """
+    if isinstance(mask, ast.BinOp) and isinstance(mask.op, ast.BitAnd):
+        left, right = _filter_conditions(mask.left), _filter_conditions(mask.right)
+        return None if left is None or right is None else left + right
+
+    if isinstance(mask, ast.Compare) and len(mask.ops) == 1 and type(mask.ops[0]) in _COMPARE_OPS:
+        op = _COMPARE_OPS[type(mask.ops[0])]
+        column, operand = _indexed_column(mask.left), mask.comparators[0]
+        if column is None:
+            column, operand, op = _indexed_column(mask.comparators[0]), mask.left, _FLIPPED_OPS[op]
+        value, ok = _literal(operand)
+        if column is None or not ok or isinstance(value, (list, tuple, set, dict)):
+            return None
+        return [(column, op, value)]
+
+    if isinstance(mask, ast.Call) and isinstance(mask.func, ast.Attribute) and not mask.keywords:
+        column = _indexed_column(mask.func.value)
+        if column is None:
+            return None
+        if mask.func.attr == "isin" and len(mask.args) == 1:
+            values, ok = _literal(mask.args[0])
+            if ok and isinstance(values, (list, tuple, set)):
+                return [(column, "isin", tuple(values))]
+        if mask.func.attr == "between" and len(mask.args) == 2:
+            low, low_ok = _literal(mask.args[0])
+            high, high_ok = _literal(mask.args[1])
+            if low_ok and high_ok:
+                return [(column, "between", (low, high))]
+    return None
+
+
+def _column_selection(node):
+    """
+    Whether the node is a literal column label or list of column labels.
+    """
+    value, ok = _literal(node)
+    if ok and isinstance(value, list):
+        return all(isinstance(item, str) for item in value)
+    return ok and isinstance(value, str)
+
+
+class _IndexedFilterRewriter(ast.NodeTransformer):
+    """
+    Replaces `df[mask]` and `df.loc[mask]` by `_indexed_filter(df, conditions, lambda: mask)`
+    for masks the column index understands; the lambda keeps the original mask as fallback.
+    A column selection right after the filter (`df[mask][cols]`, `df.loc[mask, cols]`) is
+    passed along, so only the selected columns are gathered.
+    """
+
+    def __init__(self):
+        self.rewrites = 0
+
+    def _indexed_call(self, mask, columns=None):
+        conditions = _filter_conditions(mask)
+        if conditions is None:
+            return None
+        self.rewrites += 1
+        args = [
+            ast.Name(id="df", ctx=ast.Load()),
+            ast.Constant(tuple(conditions)),
+            ast.Lambda(
+                args=ast.arguments(posonlyargs=[], args=[], kwonlyargs=[], kw_defaults=[], defaults=[]),
+                body=mask,
+            ),
+        ]
+        if columns is not None:
+            args.append(columns)
+        return ast.Call(func=ast.Name(id=INDEX_FILTER, ctx=ast.Load()), args=args, keywords=[])
+
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.ctx, ast.Load):
+            return node
+        frame = node.value
+
+        # _indexed_filter(df, conditions, mask)[cols] -> _indexed_filter(df, conditions, mask, cols)
+        if isinstance(frame, ast.Call) and isinstance(frame.func, ast.Name) and frame.func.id == INDEX_FILTER:
+            if len(frame.args) == 3 and _column_selection(node.slice):
+                frame.args.append(node.slice)
+                return frame
+            return node
+
+        is_loc = isinstance(frame, ast.Attribute) and frame.attr == "loc"
+        if is_loc:
+            frame = frame.value
+        if not (isinstance(frame, ast.Name) and frame.id == "df"):
+            return node
+
+        mask, columns = node.slice, None
+        if is_loc and isinstance(mask, ast.Tuple) and len(mask.elts) == 2 and _column_selection(mask.elts[1]):
+            mask, columns = mask.elts
+        return self._indexed_call(mask, columns) or node
+
+
+def _check_names(tree, allowed_names):
+    assigned = set()
+    for node in ast.walk(tree):
+        if isinstance(node, _FORBIDDEN_NODES):
+            raise CodeAnalysisError(f"'{type(node).__name__}' statements are not allowed.")
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            assigned.add(node.id)
+        elif isinstance(node, ast.arg):
+            assigned.add(node.arg)
+        elif isinstance(node, ast.FunctionDef):
+            assigned.add(node.name)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            assigned.add(node.name)
+
+    permitted = set(allowed_names) | assigned | set(SAFE_BUILTINS)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            if node.id.startswith("__") or node.id not in permitted:
+                raise CodeAnalysisError(f"Name '{node.id}' is not allowed in generated code.")
+
+
+def prepare_code(code, allowed_names=QUERY_NAMES):
+    """
+    Statically analyzes generated code, rewrites known slow pandas patterns and
+    compiles the result. Results are cached on both the given and the rewritten
+    source text, so code is only analyzed and compiled once even when the rewritten
+    source returned here is prepared again before it is executed. Line numbers of
+    the code object refer to the rewritten source.
+    Filters on 'df' are additionally compiled to column index lookups (unless the
+    code modifies 'df'); the returned source does not include those.
+    Returns a (rewritten_source, code_object) tuple, raises CodeAnalysisError.
+    """
+    with _prepared_lock:
+        if (code, allowed_names) in _prepared:
+            _prepared.move_to_end((code, allowed_names))
+            return _prepared[(code, allowed_names)]
+
+    prepared = _prepare_code(code, allowed_names)
+    with _prepared_lock:
+        _prepared[(code, allowed_names)] = prepared
+        _prepared[(prepared[0], allowed_names)] = prepared
+        while len(_prepared) > MAX_PREPARED_CODE:
+            _prepared.popitem(last=False)
+    return prepared
+
+
+def _prepare_code(code, allowed_names):
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise CodeAnalysisError(f"Generated code is not valid Python: {e}") from e
+
+    rewriter = _SlowPatternRewriter()
+    tree = ast.fix_missing_locations(rewriter.visit(tree))
+    _check_names(tree, allowed_names)
+
+    source = ast.unparse(tree)
+    if rewriter.rewrites:
+        logger.info(f"Rewrote slow patterns in generated code: {', '.join(rewriter.rewrites)}")
+        console.log(f"Rewritten code: {source}")
+
+    # Compile the returned source rather than the original tree, so line numbers in
+    # the code object (and in profiles) match it whichever text it was cached under
+    tree = ast.parse(source)
+    if not _mutates_df(tree):
+        index_rewriter = _IndexedFilterRewriter()
+        tree = ast.fix_missing_locations(index_rewriter.visit(tree))
+        if index_rewriter.rewrites:
+            logger.info(f"Compiled {index_rewriter.rewrites} filter(s) to column index lookups")
+    return source, compile(tree, GENERATED_FILENAME, "exec")
+
+
+@lru_cache(maxsize=256)
+def referenced_names(code):
+    """
+    Names the code reads, e.g. to find which datasets it needs.
+    """
+    return frozenset(
+        node.id for node in ast.walk(ast.parse(code))
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    )
+
+
+@lru_cache(maxsize=256)
+def referenced_columns(code, columns):
+    """
+    Which of 'columns' (a frozenset) the code refers to, either as literals such as
+    df["col"] or groupby("col"), or as attributes such as df.col.
+    """
+    found = set()
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value in columns:
+            found.add(node.value)
+        elif isinstance(node, ast.Attribute) and node.attr in columns:
+            found.add(node.attr)
+    return frozenset(found)
+
+
+class _Normalizer(ast.NodeTransformer):
+    """
+    Rewrites code into a canonical form: `df.col` becomes `df["col"]`, operands of
+    `&` / `|` mask chains are sorted, literals move to the right of comparisons and
+    the code's own variables are renamed in order of appearance.
+    """
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.names = {}
+
+    def _rename(self, name):
+        if name in self.keep or name in SAFE_BUILTINS:
+            return name
+        return self.names.setdefault(name, f"_v{len(self.names)}")
+
+    def visit_Name(self, node):
+        node.id = self._rename(node.id)
+        return node
+
+    def visit_arg(self, node):
+        node.arg = self._rename(node.arg)
+        node.annotation = None
+        return node
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        if isinstance(node.value, ast.Name) and node.value.id == "df" and not hasattr(pd.DataFrame, node.attr):
+            return ast.Subscript(value=node.value, slice=ast.Constant(node.attr), ctx=node.ctx)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        op = _COMPARE_OPS.get(type(node.ops[0]))
+        if len(node.ops) == 1 and op and isinstance(node.left, ast.Constant) and not isinstance(node.comparators[0], ast.Constant):
+            flipped = {value: key for key, value in _COMPARE_OPS.items()}[_FLIPPED_OPS[op]]
+            return ast.Compare(left=node.comparators[0], ops=[flipped()], comparators=[node.left])
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            return node
+
+        def operands(part):
+            if isinstance(part, ast.BinOp) and type(part.op) is type(node.op):
+                return operands(part.left) + operands(part.right)
+            return [part]
+
+        parts = operands(node)
+        if not all(_is_mask(part) for part in parts):
+            return node
+        parts.sort(key=ast.dump)
+        result = parts[0]
+        for part in parts[1:]:
+            result = ast.BinOp(left=result, op=node.op, right=part)
+        return result
+
+
+@lru_cache(maxsize=256)
+def normalize_code(code, allowed_names=QUERY_NAMES):
+    """
+    Returns a key that is equal for analyzed code snippets that only differ in
+    formatting, variable names, column access style or the order of `&` / `|` filters.
+    """
+    tree = _Normalizer(allowed_names).visit(ast.parse(code))
+    return hashlib.sha256(ast.dump(tree).encode()).hexdigest()
+
+
+def make_namespace(index=None, **names):
+    """
+    Builds the globals for executing generated code, exposing only whitelisted builtins
+    and the column index of the dataset ('index' may be None). Index lookups are only
+    used for filters on the exact 'df' object placed in the namespace.
+    """
+    return {
+        "__builtins__": dict(SAFE_BUILTINS),
+        INDEX_FILTER: make_indexed_filter(index, names.get("df")),
+        **names,
+    }
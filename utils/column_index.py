@@ -0,0 +1,146 @@
+# utils/column_index.py
+
+import logging
+import numpy as np
+import pandas as pd
+from rich.console import Console
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+# Non-numeric columns with at most this many distinct values get a value -> rows map
+MAX_CATEGORIES = 1000
+
+_RANGE_OPS = {"<", "<=", ">", ">="}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class ColumnIndex:
+    """
+    Row-position indexes over a dataframe, built once per dataset:
+    - low-cardinality columns map every value to the sorted positions of its rows;
+    - numeric columns keep a sorted permutation, so ranges are two binary searches.
+    Lookups return sorted row positions, or None when a condition cannot be
+    answered from the index and the caller has to evaluate the mask itself.
+    """
+
+    def __init__(self, df):
+        self.num_rows = len(df)
+        self.value_positions = {}
+        self.sorted_columns = {}
+        position_dtype = np.int32 if self.num_rows < 2 ** 31 else np.int64
+
+        for column in df.columns:
+            series = df[column]
+            if not isinstance(series, pd.Series):
+                continue  # duplicated column name
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                if isinstance(series.dtype, np.dtype) and series.dtype.kind in "iu":
+                    values = series.to_numpy()
+                else:
+                    values = series.to_numpy(dtype="float64", na_value=np.nan)
+                valid = np.flatnonzero(~pd.isna(values))
+                order = valid[np.argsort(values[valid], kind="stable")].astype(position_dtype)
+                self.sorted_columns[column] = (values[order], order)
+            elif pd.api.types.is_datetime64_any_dtype(series):
+                continue
+            elif series.nunique() <= MAX_CATEGORIES:
+                groups = series.groupby(series, sort=False, observed=True).indices
+                self.value_positions[column] = {
+                    value: positions.astype(position_dtype) for value, positions in groups.items()
+                }
+
+        logger.info(
+            f"Built column index: {len(self.value_positions)} categorical, "
+            f"{len(self.sorted_columns)} numeric columns over {self.num_rows} rows"
+        )
+
+    def _complement(self, positions):
+        return np.setdiff1d(np.arange(self.num_rows, dtype=positions.dtype), positions, assume_unique=True)
+
+    def _value_positions(self, column, op, value):
+        values = self.value_positions[column]
+        empty = np.array([], dtype=np.int64)
+        if op in ("==", "!="):
+            if value is None or isinstance(value, float):
+                return None
+            try:
+                positions = values.get(value, empty)
+            except TypeError:
+                return None
+            return positions if op == "==" else self._complement(positions)
+        if op == "isin":
+            if any(item is None or isinstance(item, float) for item in value):
+                return None
+            try:
+                return np.sort(np.concatenate([values.get(item, empty) for item in value] + [empty]))
+            except TypeError:
+                return None
+        return None
+
+    def _sorted_positions(self, column, op, value):
+        sorted_values, order = self.sorted_columns[column]
+
+        def between(low, low_side, high, high_side):
+            start = 0 if low is None else np.searchsorted(sorted_values, low, side=low_side)
+            stop = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side=high_side)
+            return np.sort(order[start:stop])
+
+        if op in ("==", "!=") and _is_number(value):
+            positions = between(value, "left", value, "right")
+            return positions if op == "==" else self._complement(positions)
+        if op in _RANGE_OPS and _is_number(value):
+            return {
+                ">": lambda: between(value, "right", None, None),
+                ">=": lambda: between(value, "left", None, None),
+                "<": lambda: between(None, None, value, "left"),
+                "<=": lambda: between(None, None, value, "right"),
+            }[op]()
+        if op == "between" and all(_is_number(bound) for bound in value):
+            return between(value[0], "left", value[1], "right")
+        if op == "isin" and all(_is_number(item) for item in value):
+            parts = [between(item, "left", item, "right") for item in value]
+            return np.unique(np.concatenate(parts)) if parts else np.array([], dtype=order.dtype)
+        return None
+
+    def lookup(self, conditions):
+        """
+        Returns the sorted positions of the rows matching all (column, op, value)
+        conditions, or None if any of them is not answerable from the index.
+        """
+        result = None
+        for column, op, value in conditions:
+            if column in self.sorted_columns:
+                positions = self._sorted_positions(column, op, value)
+            elif column in self.value_positions:
+                positions = self._value_positions(column, op, value)
+            else:
+                positions = None
+            if positions is None:
+                return None
+            result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+        return result
+
+
+def make_indexed_filter(index, indexed_frame=None):
+    """
+    Returns the function that index-rewritten code calls in place of `df[mask]` or
+    `df[mask][columns]`. It answers the filter from 'index' when it is applied to
+    'indexed_frame' itself (whose rows the index describes) and otherwise evaluates
+    the original mask; another frame of the same length may have its rows reordered.
+    """
+    def indexed_filter(frame, conditions, mask, columns=None):
+        positions = None
+        if index is not None and frame is indexed_frame and len(frame) == index.num_rows:
+            positions = index.lookup(conditions)
+        if positions is None:
+            logger.debug(f"Column index miss for {conditions}")
+            result = frame[mask()]
+            return result if columns is None else result[columns]
+        logger.debug(f"Column index hit for {conditions}: {len(positions)} rows")
+        return (frame if columns is None else frame[columns]).take(positions)
+
+    return indexed_filter
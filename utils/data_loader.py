@@ -1,18 +1,99 @@
 # utils/data_loader.py
 
+import os
+import datetime
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import logging
+from pandas._libs.parsers import STR_NA_VALUES
 from rich.console import Console
 
 console = Console()
 logger = logging.getLogger(__name__)
 
+# Threads used to parse a CSV file; defaults to one per CPU
+CSV_PARSE_THREADS = int(os.getenv("CSV_PARSE_THREADS", "0")) or os.cpu_count()
+pa.set_cpu_count(CSV_PARSE_THREADS)
+
+# Leading bytes of the compressed formats accepted for uploads
+_COMPRESSION_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"BZh": "bz2",
+}
+
+
+def detect_compression(filepath):
+    """
+    Returns 'gzip', 'zstd' or 'bz2' from the file's leading bytes, or None for plain text.
+    """
+    with open(filepath, "rb") as file:
+        head = file.read(4)
+    for magic, compression in _COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _temporal_columns(df):
+    """
+    Columns pyarrow parsed as dates, times or timestamps. The default parser keeps
+    these as strings, and generated code (e.g. `.str` accessors) relies on that.
+    """
+    columns = []
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            columns.append(column)
+        elif series.dtype == object:
+            first = series.first_valid_index()
+            if first is not None and isinstance(series[first], (datetime.date, datetime.time)):
+                columns.append(column)
+    return columns
+
+
+def _read_as_text(filepath, compression, columns):
+    """
+    Reads 'columns' again as plain strings with pyarrow, treating the same values
+    as missing as pandas does.
+    """
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=columns,
+        column_types={column: pa.string() for column in columns},
+        null_values=sorted(STR_NA_VALUES),
+        strings_can_be_null=True,
+    )
+    with pa.input_stream(filepath, compression=compression) as stream:
+        table = pa_csv.read_csv(stream, convert_options=convert_options)
+    return {column: table.column(column).to_pandas() for column in columns}
+
+
 def load_csv(filepath):
     logger.info(f"Loading CSV file from '{filepath}'")
     try:
-        df = pd.read_csv(filepath)
-        logger.info(f"Loaded dataframe with shape {df.shape}")
-        return df
+        compression = detect_compression(filepath)
     except Exception as e:
         logger.error(f"Error loading CSV file: {e}")
         return None
+
+    try:
+        # Decompress while reading and parse with pyarrow's multi-threaded reader
+        with pa.input_stream(filepath, compression=compression) as stream:
+            df = pd.read_csv(stream, engine="pyarrow")
+        # pandas cannot pass pyarrow an option to leave temporal values alone, so read
+        # only those columns again as strings
+        temporal = _temporal_columns(df)
+        if temporal:
+            logger.info(f"Re-reading temporal columns {temporal} as text")
+            for column, values in _read_as_text(filepath, compression, temporal).items():
+                df[column] = values
+    except Exception as e:
+        logger.warning(f"Multi-threaded CSV parsing failed, using the default parser: {e}")
+        try:
+            df = pd.read_csv(filepath, compression=compression)
+        except Exception as e:
+            logger.error(f"Error loading CSV file: {e}")
+            return None
+    logger.info(f"Loaded dataframe with shape {df.shape} ({compression or 'uncompressed'})")
+    return df
@@ -0,0 +1,190 @@
+# utils/dataset_store.py
+
+import os
+import re
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from rich.console import Console
+from utils.data_loader import load_csv
+from utils.column_index import ColumnIndex
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "data"
+UPLOADS_DIR = os.path.join(DATA_DIR, "uploads")
+
+# Size of the chunks clients should send for resumable uploads
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Number of parsed datasets (with their column index) kept in memory
+MAX_LOADED_DATASETS = 4
+
+_CONTENT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+# Datasets are immutable under their content id, so a cached frame and index
+# can only go stale by being evicted; new data always arrives under a new id.
+_loaded = OrderedDict()
+
+
+class UploadError(ValueError):
+    """
+    Raised when an upload chunk or a completed upload does not match what the server expects.
+    """
+
+
+def _lock_for(content_id):
+    with _locks_guard:
+        return _locks.setdefault(content_id, threading.Lock())
+
+
+def is_content_id(value):
+    return bool(value) and _CONTENT_ID.match(value) is not None
+
+
+def dataset_path(content_id):
+    return os.path.join(DATA_DIR, f"{content_id}.csv")
+
+
+def _metadata_path(content_id):
+    return os.path.join(DATA_DIR, f"{content_id}.json")
+
+
+def _partial_path(content_id):
+    return os.path.join(UPLOADS_DIR, f"{content_id}.part")
+
+
+def dataset_exists(content_id):
+    return is_content_id(content_id) and os.path.exists(dataset_path(content_id))
+
+
+def dataset_metadata(content_id):
+    try:
+        with open(_metadata_path(content_id), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def list_datasets():
+    """
+    All stored datasets with their original file name and size.
+    """
+    datasets = []
+    for name in sorted(os.listdir(DATA_DIR)):
+        content_id, extension = os.path.splitext(name)
+        if extension == ".json" and dataset_exists(content_id):
+            datasets.append({"dataset_id": content_id, **dataset_metadata(content_id)})
+    return datasets
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def add_dataset(path, content_id, filename):
+    """
+    Moves a fully received file with a known sha256 into the content-addressed store.
+    """
+    target = dataset_path(content_id)
+    with _lock_for(content_id):
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            os.replace(path, target)
+        with open(_metadata_path(content_id), "w") as file:
+            json.dump({"filename": filename, "size": os.path.getsize(target)}, file)
+    logger.info(f"Dataset '{filename}' stored as '{content_id}'")
+    return content_id
+
+
+def upload_offset(content_id):
+    """
+    Number of bytes already received for an unfinished upload.
+    """
+    try:
+        return os.path.getsize(_partial_path(content_id))
+    except OSError:
+        return 0
+
+
+def begin_upload(content_id):
+    """
+    Starts or resumes an upload and returns the offset the client should continue from.
+    """
+    if not is_content_id(content_id):
+        raise UploadError(f"'{content_id}' is not a sha256 hex digest.")
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    offset = upload_offset(content_id)
+    logger.info(f"Upload of '{content_id}' starts at offset {offset}")
+    return offset
+
+
+def append_chunk(content_id, offset, data):
+    """
+    Appends a chunk at 'offset' and returns the new offset. Chunks must arrive in order;
+    a mismatching offset raises UploadError so the client can resume from the right place.
+    """
+    if not is_content_id(content_id):
+        raise UploadError(f"'{content_id}' is not a sha256 hex digest.")
+    with _lock_for(content_id):
+        current = upload_offset(content_id)
+        if offset != current:
+            raise UploadError(f"Expected offset {current}, got {offset}.")
+        with open(_partial_path(content_id), "ab") as file:
+            file.write(data)
+        return current + len(data)
+
+
+def complete_upload(content_id, filename):
+    """
+    Verifies the received bytes against their content id and adds them to the store.
+    """
+    path = _partial_path(content_id)
+    if not os.path.exists(path):
+        raise UploadError(f"No upload in progress for '{content_id}'.")
+    digest = file_sha256(path)
+    if digest != content_id:
+        os.remove(path)
+        raise UploadError(f"Uploaded bytes hash to '{digest}', not '{content_id}'.")
+    return add_dataset(path, content_id, filename)
+
+
+def load_dataset(content_id, with_index=True):
+    """
+    Returns (df, column_index) for a stored dataset, parsing the CSV on first use.
+    The column index is only built if 'with_index' is True, otherwise it may be None;
+    datasets that are never filtered through an index (e.g. joined ones) skip that cost.
+    Returns (None, None) if the dataset cannot be loaded.
+    Callers must not modify the returned frame in place.
+    """
+    with _lock_for(content_id):
+        with _locks_guard:
+            entry = _loaded.get(content_id)
+            if entry is not None:
+                _loaded.move_to_end(content_id)
+        if entry is not None and (entry[1] is not None or not with_index):
+            return entry
+
+        df = entry[0] if entry is not None else load_csv(dataset_path(content_id))
+        if df is None:
+            return None, None
+        index = ColumnIndex(df) if with_index else None
+
+        with _locks_guard:
+            _loaded[content_id] = (df, index)
+            _loaded.move_to_end(content_id)
+            while len(_loaded) > MAX_LOADED_DATASETS:
+                evicted, _ = _loaded.popitem(last=False)
+                logger.info(f"Evicted dataset '{evicted}' from memory")
+    return df, index
@@ -0,0 +1,144 @@
+# utils/profiler.py
+
+import sys
+import time
+import threading
+import tracemalloc
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from rich.console import Console
+from utils.code_analyzer import GENERATED_FILENAME
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+# Seconds between two stack samples of the profiled thread
+SAMPLE_INTERVAL = 0.005
+# Number of hottest lines returned per profile
+TOP_LINES = 5
+# Log the overall top offenders after this many profiled executions
+LOG_EVERY = 20
+
+_offenders = Counter()
+_offenders_lock = threading.Lock()
+_profiled_runs = 0
+
+# tracemalloc is process-wide: it is started by the first active profile and stopped
+# by the last one, and its peak is only reset when no other profile is running
+_tracing_lock = threading.Lock()
+_tracing = {"active": 0, "started": 0, "owned": False}
+
+
+def _start_tracing():
+    """
+    Returns (baseline, started, overlapped): the traced memory at the start, the
+    number of profiles started so far and whether another profile is running.
+    """
+    with _tracing_lock:
+        overlapped = _tracing["active"] > 0
+        if not overlapped:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracing["owned"] = True
+            tracemalloc.reset_peak()
+        _tracing["active"] += 1
+        _tracing["started"] += 1
+        baseline, _ = tracemalloc.get_traced_memory()
+        return baseline, _tracing["started"], overlapped
+
+
+def _stop_tracing(started, overlapped):
+    """
+    Returns (peak, overlapped), where overlapped also covers profiles started
+    after this one.
+    """
+    with _tracing_lock:
+        _, peak = tracemalloc.get_traced_memory()
+        overlapped = overlapped or _tracing["started"] != started or _tracing["active"] > 1
+        _tracing["active"] -= 1
+        if _tracing["active"] == 0 and _tracing["owned"]:
+            tracemalloc.stop()
+            _tracing["owned"] = False
+        return peak, overlapped
+
+
+def _sample(thread_id, stop, counts):
+    """
+    Periodically records which line of the generated code the profiled thread is executing.
+    """
+    while not stop.wait(SAMPLE_INTERVAL):
+        frame = sys._current_frames().get(thread_id)
+        counts["total"] += 1
+        while frame is not None:
+            if frame.f_code.co_filename == GENERATED_FILENAME:
+                counts[frame.f_lineno] += 1
+                break
+            frame = frame.f_back
+
+
+def _record_offenders(hot_lines):
+    global _profiled_runs
+    with _offenders_lock:
+        for line in hot_lines:
+            _offenders[line["code"]] += line["seconds"]
+        _profiled_runs += 1
+        if _profiled_runs % LOG_EVERY == 0:
+            summary = "; ".join(f"{seconds:.3f}s: {code}" for code, seconds in _offenders.most_common(TOP_LINES))
+            logger.info(f"Top generated code lines after {_profiled_runs} profiled runs: {summary}")
+
+
+def top_offenders(n=TOP_LINES):
+    """
+    Generated code lines with the most cumulative profiled time.
+    """
+    with _offenders_lock:
+        return [{"code": code, "seconds": round(seconds, 4)} for code, seconds in _offenders.most_common(n)]
+
+
+@contextmanager
+def profiled(source):
+    """
+    Profiles the generated code executed inside the block on the current thread with a
+    sampling profiler and tracemalloc. 'source' is the code as compiled, used to show
+    the hottest lines. Yields a dict that is filled in when the block exits.
+    Memory is traced process-wide; if other profiles ran at the same time the peak
+    includes their allocations and the report says so in 'memory_overlapped'.
+    """
+    report = {}
+    counts = Counter()
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample, args=(threading.get_ident(), stop, counts), daemon=True)
+
+    baseline, profile_number, overlapped = _start_tracing()
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        yield report
+    finally:
+        stop.set()
+        sampler.join()
+        wall = time.perf_counter() - started
+        peak, overlapped = _stop_tracing(profile_number, overlapped)
+
+        lines = source.splitlines()
+        total = counts.pop("total", 0)
+        hot_lines = [
+            {
+                "line": lineno,
+                "code": lines[lineno - 1].strip() if 0 < lineno <= len(lines) else "",
+                "samples": samples,
+                "share": round(samples / total, 3),
+                "seconds": round(wall * samples / total, 4),
+            }
+            for lineno, samples in counts.most_common(TOP_LINES)
+        ]
+        report.update({
+            "wall_seconds": round(wall, 4),
+            "samples": total,
+            "hot_lines": hot_lines,
+            "peak_memory_bytes": max(peak - baseline, 0),
+            "memory_overlapped": overlapped,
+        })
+        _record_offenders(hot_lines)
+        logger.info(f"Profiled generated code: {wall:.3f}s, peak {report['peak_memory_bytes']} bytes")
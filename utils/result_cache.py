@@ -0,0 +1,84 @@
+# utils/result_cache.py
+
+import sys
+import threading
+import logging
+import pandas as pd
+from rich.console import Console
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+# Memory budget for cached query results
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+# Returned by get_cached() when there is no entry, since None is not a valid result
+MISS = object()
+
+_entries = {}
+_lock = threading.Lock()
+# GreedyDual-Size clock: rises to the priority of every evicted entry, so entries
+# that are not hit again age out even if they were expensive
+_clock = 0.0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "saved_seconds": 0.0}
+
+
+def _size_of(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    return sys.getsizeof(value)
+
+
+def _priority(cost, size):
+    # Expensive-to-recompute and small results are worth the most per cached byte
+    return _clock + cost / max(size, 1)
+
+
+def get_cached(key):
+    """
+    Returns the cached result for 'key', or MISS.
+    """
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            return MISS
+        entry["priority"] = _priority(entry["cost"], entry["size"])
+        _stats["hits"] += 1
+        _stats["saved_seconds"] += entry["cost"]
+        return entry["value"]
+
+
+def put_cached(key, value, cost):
+    """
+    Caches a result that took 'cost' seconds to compute, evicting the entries with the
+    lowest cost per byte until it fits into MAX_CACHE_BYTES.
+    """
+    global _clock
+    size = _size_of(value)
+    if size > MAX_CACHE_BYTES:
+        logger.info(f"Result of {size} bytes exceeds the cache budget, not caching")
+        return
+
+    with _lock:
+        _entries.pop(key, None)
+        used = sum(entry["size"] for entry in _entries.values())
+        while _entries and used + size > MAX_CACHE_BYTES:
+            victim = min(_entries, key=lambda k: _entries[k]["priority"])
+            evicted = _entries.pop(victim)
+            _clock = evicted["priority"]
+            used -= evicted["size"]
+            _stats["evictions"] += 1
+        _entries[key] = {"value": value, "size": size, "cost": cost, "priority": _priority(cost, size)}
+    logger.debug(f"Cached result of {size} bytes that took {cost:.3f}s")
+
+
+def cache_stats():
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "bytes": sum(entry["size"] for entry in _entries.values()),
+        }
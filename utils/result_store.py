@@ -0,0 +1,181 @@
+# utils/result_store.py
+
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rich.console import Console
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+# Number of query results kept for download; the least recently used one is dropped first
+MAX_STORED_RESULTS = 32
+
+DOWNLOAD_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_results = OrderedDict()
+_lock = threading.Lock()
+
+
+def _to_frame(query_result):
+    """
+    Converts any 'query_result' (dataframe, series, collection or scalar) to a
+    dataframe with string column names. Index labels (group keys, describe()
+    statistics, original row labels) become regular columns, renamed if they
+    collide with a column; only an unnamed RangeIndex is dropped. Object columns
+    mixing types Arrow cannot hold in one column become strings.
+    """
+    if isinstance(query_result, pd.DataFrame):
+        frame = query_result
+    elif isinstance(query_result, pd.Series):
+        frame = query_result.to_frame(name=query_result.name if query_result.name is not None else "value")
+    elif isinstance(query_result, dict):
+        try:
+            frame = pd.DataFrame(query_result)
+        except ValueError:
+            frame = pd.DataFrame({"key": list(query_result.keys()), "value": list(query_result.values())})
+    elif isinstance(query_result, (list, tuple, set)):
+        frame = pd.DataFrame({"value": list(query_result)})
+    else:
+        frame = pd.DataFrame({"value": [query_result]})
+
+    if isinstance(frame.index, pd.RangeIndex) and frame.index.name is None:
+        frame = frame.reset_index(drop=True)
+    else:
+        taken = {str(column) for column in frame.columns}
+        names = []
+        for level, name in enumerate(frame.index.names):
+            base = str(name) if name is not None else ("index" if frame.index.nlevels == 1 else f"level_{level}")
+            candidate, suffix = base, 2
+            while candidate in taken:
+                candidate, suffix = f"{base}_{suffix}", suffix + 1
+            taken.add(candidate)
+            names.append(candidate)
+        frame = frame.rename_axis(names).reset_index()
+    frame.columns = [str(column) for column in frame.columns]
+    for column in frame.columns[(frame.dtypes == object).to_numpy()]:
+        values = frame[column]
+        try:
+            pa.array(values, from_pandas=True)
+        except (pa.ArrowException, TypeError, ValueError):
+            frame[column] = values.where(values.isna(), values.astype(str))
+    return frame
+
+
+def store_result(query_result):
+    """
+    Keeps a query result for later download and returns its id. A result that cannot
+    be converted for download is only logged, so it never fails the query itself;
+    downloading it then reports the result as not found.
+    """
+    result_id = uuid.uuid4().hex
+    try:
+        frame = _to_frame(query_result)
+    except Exception as e:
+        logger.warning(f"Query result '{result_id}' cannot be stored for download: {e}")
+        return result_id
+    with _lock:
+        _results[result_id] = frame
+        while len(_results) > MAX_STORED_RESULTS:
+            _results.popitem(last=False)
+    logger.info(f"Stored query result '{result_id}' with shape {frame.shape}")
+    return result_id
+
+
+def get_result(result_id, columns=None):
+    """
+    Returns a stored result projected on 'columns', or None if the result is
+    unknown or has been evicted. Raises KeyError for unknown columns.
+    """
+    with _lock:
+        frame = _results.get(result_id)
+        if frame is None:
+            return None
+        _results.move_to_end(result_id)
+
+    if columns:
+        missing = [column for column in columns if column not in frame.columns]
+        if missing:
+            raise KeyError(f"Unknown columns: {missing}")
+        frame = frame[columns]
+    return frame
+
+
+class _ChunkSink:
+    """
+    Minimal writable file object collecting what pyarrow writes, so the bytes
+    can be streamed out batch by batch instead of building one buffer.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _batches(frame, batch_rows):
+    for offset in range(0, len(frame), batch_rows):
+        yield frame.iloc[offset:offset + batch_rows]
+
+
+def iter_ndjson(frame, batch_rows):
+    for batch in _batches(frame, batch_rows):
+        yield batch.to_json(orient="records", lines=True, date_format="iso").rstrip("\n") + "\n"
+
+
+def _write_batches(writer, sink, frame, schema, batch_rows):
+    with writer:
+        for batch in _batches(frame, batch_rows):
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_arrow(frame, batch_rows):
+    """
+    Builds the Arrow schema right away, so a frame that cannot be converted raises
+    here rather than in the middle of the stream, and returns the stream's chunks.
+    """
+    sink = _ChunkSink()
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    return _write_batches(pa.ipc.new_stream(sink, schema), sink, frame, schema, batch_rows)
+
+
+def iter_parquet(frame, batch_rows):
+    """
+    Like iter_arrow, for a Parquet file.
+    """
+    sink = _ChunkSink()
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    return _write_batches(pq.ParquetWriter(sink, schema), sink, frame, schema, batch_rows)
+
+
+STREAM_WRITERS = {
+    "ndjson": iter_ndjson,
+    "arrow": iter_arrow,
+    "parquet": iter_parquet,
+}
@@ -0,0 +1,100 @@
+# utils/speculation.py
+
+import asyncio
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from rich.console import Console
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+# Pending speculative computations; the oldest is cancelled when there are more
+MAX_SPECULATIONS = 32
+# Threads running speculative work. They are separate from the event loop's default
+# executor, so discarded LLM calls (which keep running after a cancel) never delay
+# real requests; when all are busy no new speculation is started.
+SPECULATION_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="speculation")
+# Submitted computations that have not finished, including cancelled ones still running
+_running = set()
+_running_lock = threading.Lock()
+
+# handle -> (key, task). Only touched from the event loop thread.
+_speculations = OrderedDict()
+_stats = {"started": 0, "used": 0, "cancelled": 0, "skipped": 0}
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Speculative computation failed: {task.exception()}")
+
+
+def _finished(future):
+    with _running_lock:
+        _running.discard(future)
+
+
+def start_speculation(handle, key, func):
+    """
+    Starts running 'func' on the speculation threads and keeps it under 'handle' until
+    it is taken or cancelled. 'key' identifies the request it speculates for, so a
+    confirm for a different question or dataset does not pick it up.
+    Returns False without starting anything if all speculation threads are busy.
+    """
+    with _running_lock:
+        if len(_running) >= SPECULATION_WORKERS:
+            _stats["skipped"] += 1
+            logger.info(f"Speculation threads busy, not preparing '{handle}'")
+            return False
+        future = _executor.submit(func)
+        _running.add(future)
+    future.add_done_callback(_finished)
+    task = asyncio.wrap_future(future)
+    task.add_done_callback(_log_failure)
+    _speculations[handle] = (key, task)
+    _stats["started"] += 1
+    while len(_speculations) > MAX_SPECULATIONS:
+        _, (_, stale) = _speculations.popitem(last=False)
+        stale.cancel()
+        _stats["cancelled"] += 1
+    logger.info(f"Started speculative computation for '{handle}'")
+    return True
+
+
+def take_speculation(handle, key):
+    """
+    Removes and returns the task started under 'handle' for 'key', or None.
+    """
+    entry = _speculations.pop(handle, None)
+    if entry is None:
+        return None
+    entry_key, task = entry
+    if entry_key != key:
+        task.cancel()
+        _stats["cancelled"] += 1
+        return None
+    _stats["used"] += 1
+    return task
+
+
+def cancel_speculation(handle):
+    """
+    Cancels the computation started under 'handle'. A call that already reached the
+    LLM keeps running in its speculation thread, but its result is dropped.
+    """
+    entry = _speculations.pop(handle, None)
+    if entry is None:
+        return False
+    entry[1].cancel()
+    _stats["cancelled"] += 1
+    logger.info(f"Cancelled speculative computation for '{handle}'")
+    return True
+
+
+def speculation_stats():
+    with _running_lock:
+        running = len(_running)
+    return {**_stats, "pending": len(_speculations), "running": running}
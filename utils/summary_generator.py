@@ -1,13 +1,139 @@
 # utils/summary_generator.py
 
+import re
+import threading
 import logging
 from rich.console import Console
+from utils.code_analyzer import referenced_columns
 
 console = Console()
 logger = logging.getLogger(__name__)
 
-def generate_summary(df):
+# Maximum prompt tokens of a summary built for a specific question
+SUMMARY_TOKEN_BUDGET = 1500
+# Column names shorter than this are not looked for in the question text
+MIN_MENTION_LENGTH = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+# Rows of describe(include='all') (header and 11 statistics) and the width of its cells
+_DESCRIBE_LINES = 12
+_DESCRIBE_CELL_WIDTH = 11
+
+_stats = {"summaries": 0, "prompt_tokens": 0, "tokens_saved": 0}
+_stats_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """
+    Number of gpt-4o tokens in 'text', or an estimate of 4 characters per token if
+    the tokenizer cannot be loaded.
+    """
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model("gpt-4o")
+            except Exception as e:
+                logger.warning(f"Tokenizer unavailable, estimating token counts: {e}")
+                _encoding = False
+    if _encoding is False:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text))
+
+
+def _column_key(name):
+    return re.sub(r"[\W_]+", "", str(name).lower())
+
+
+def mentioned_columns(question, columns):
+    """
+    Columns whose name appears in the question, ignoring case, spaces and underscores.
+    """
+    text = _column_key(question)
+    return [
+        column for column in columns
+        if len(_column_key(column)) >= MIN_MENTION_LENGTH and _column_key(column) in text
+    ]
+
+
+def _overview(df):
+    dtypes = ", ".join(f"{count} {dtype}" for dtype, count in df.dtypes.astype(str).value_counts().items())
+    return (
+        f"{len(df)} rows, {len(df.columns)} columns ({dtypes}).\n"
+        f"Columns: {', '.join(map(str, df.columns))}"
+    )
+
+
+def _estimate_full_tokens(df, summary):
+    """
+    Estimates the tokens of the full describe(include='all') table from its layout
+    (one padded cell per column and statistic), at the token density of 'summary',
+    so the savings can be reported without describing the whole frame.
+    """
+    width = 6 + sum(max(len(str(column)), _DESCRIBE_CELL_WIDTH) + 2 for column in df.columns)
+    return int(_DESCRIBE_LINES * width * count_tokens(summary) / max(len(summary), 1))
+
+
+def generate_summary(df, question=None, code=None, token_budget=SUMMARY_TOKEN_BUDGET):
+    """
+    Summarizes the dataframe for the response prompt. Without a question or code this is
+    the full describe() table. Otherwise it is a short overview of the whole dataset plus
+    statistics only for the columns the executed code or the question refer to, kept
+    within 'token_budget' tokens.
+    """
     logger.info("Generating summary of dataframe.")
-    summary = df.describe(include='all').to_string()
+    if question is None and code is None:
+        summary = df.describe(include='all').to_string()
+        logger.debug(f"Generated summary: {summary}")
+        return summary
+
+    columns = [column for column in df.columns if isinstance(column, str)]
+    relevant = []
+    if code:
+        try:
+            used = referenced_columns(code, frozenset(columns))
+        except SyntaxError:
+            used = frozenset()
+        relevant = [column for column in df.columns if column in used]
+    for column in mentioned_columns(question or "", df.columns):
+        if column not in relevant:
+            relevant.append(column)
+
+    summary = _overview(df)
+    if count_tokens(summary) > token_budget:
+        summary = f"{len(df)} rows, {len(df.columns)} columns."
+    if relevant:
+        # One row per column, so the table can be cut at the budget
+        lines = df[relevant].describe(include='all').T.to_string().splitlines()
+        kept = [lines[0]]
+        used_tokens = count_tokens(summary) + count_tokens(lines[0])
+        for line in lines[1:]:
+            used_tokens += count_tokens(line)
+            if used_tokens > token_budget:
+                logger.info(f"Summary budget reached after {len(kept) - 1} of {len(relevant)} columns")
+                break
+            kept.append(line)
+        if len(kept) > 1:
+            summary += "\n\nStatistics of the relevant columns:\n" + "\n".join(kept)
+
+    prompt_tokens = count_tokens(summary)
+    saved = max(_estimate_full_tokens(df, summary) - prompt_tokens, 0)
+    with _stats_lock:
+        _stats["summaries"] += 1
+        _stats["prompt_tokens"] += prompt_tokens
+        _stats["tokens_saved"] += saved
+    logger.info(f"Summary of {len(relevant)} relevant columns: {prompt_tokens} tokens, {saved} saved")
     logger.debug(f"Generated summary: {summary}")
     return summary
+
+
+def summary_stats():
+    """
+    Question-specific summaries built, their prompt tokens and the tokens saved
+    compared to the (estimated) full describe() table.
+    """
+    with _stats_lock:
+        return dict(_stats)